@@ -0,0 +1,48 @@
+"""WSGI entry point used by the load-testing benchmark.
+
+Wraps ``utils.app`` with two benchmark-only changes:
+
+* Gemini is replaced by :mod:`benchmarks.stub_gemini` so ``/api/chat`` never
+  leaves the machine (latency from ``BENCH_GEMINI_LATENCY_MS`` /
+  ``BENCH_GEMINI_JITTER_MS``, failure fraction from ``BENCH_GEMINI_ERROR_RATE``).
+* ``/_bench/login`` logs a synthetic user in, standing in for Google OAuth.
+* Templates and static files are served from the repository root, where they
+  live, rather than from ``utils/`` next to the app module.
+
+Run it with gunicorn, pointing ``SERENITY_DATA_DIR`` at a scratch directory::
+
+    SERENITY_DATA_DIR=/tmp/serenity-bench gunicorn benchmarks.bench_app:app
+"""
+import os
+
+from flask import jsonify, request
+from flask_login import login_user
+
+from utils.app import app, genai
+from utils.storage import User
+from benchmarks.stub_gemini import install_stub
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+app.template_folder = os.path.join(REPO_ROOT, 'templates')
+app.static_folder = os.path.join(REPO_ROOT, 'static')
+
+install_stub(
+    genai,
+    latency_ms=float(os.getenv('BENCH_GEMINI_LATENCY_MS', '800')),
+    jitter_ms=float(os.getenv('BENCH_GEMINI_JITTER_MS', '200')),
+    error_rate=float(os.getenv('BENCH_GEMINI_ERROR_RATE', '0')),
+)
+
+
+@app.route('/_bench/login', methods=['POST'])
+def bench_login():
+    """Find or create a benchmark user and log them in without OAuth"""
+    data = request.get_json(silent=True) or {}
+    email = data.get('email', 'bench-user@example.com')
+
+    user = User.find_by_email(email)
+    if not user:
+        user = User.create(email=email, name=data.get('name', 'Bench User'))
+
+    login_user(user)
+    return jsonify({'success': True, 'user_id': user.id})
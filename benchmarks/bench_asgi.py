@@ -0,0 +1,6 @@
+"""ASGI variant of :mod:`benchmarks.bench_app` for ``load_test.py --server asgi``::
+
+    SERENITY_DATA_DIR=/tmp/serenity-bench uvicorn benchmarks.bench_asgi:app
+"""
+import benchmarks.bench_app  # noqa: F401  installs the Gemini stub and the fake login route
+from utils.asgi import app  # noqa: F401
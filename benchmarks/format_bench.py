@@ -0,0 +1,90 @@
+"""Compare storage file formats on a generated dataset.
+
+For every collection and every format in :mod:`utils.serializers` this
+reports serialize time, full parse time, streaming read time and size on
+disk::
+
+    python -m benchmarks.generate_dataset --scale 100k --output /tmp/serenity-100k
+    python -m benchmarks.format_bench --dataset /tmp/serenity-100k --repeat 3
+
+Times are the median over ``--repeat`` runs. Formats whose optional package
+is not installed are skipped.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from utils.serializers import CODECS, get_codec
+
+COLLECTIONS = ['users', 'medications', 'medication_logs', 'health_logs', 'emergency_contacts']
+
+
+def median_seconds(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def bench_codec(codec, records, work_dir, repeat):
+    path = os.path.join(work_dir, 'bench' + codec.extension)
+    codec.write(path, records)
+    with open(path, 'rb') as f:
+        data = f.read()
+    return {
+        'serialize_ms': median_seconds(lambda: codec.dumps(records), repeat) * 1000,
+        'parse_ms': median_seconds(lambda: codec.loads(data), repeat) * 1000,
+        'stream_ms': median_seconds(lambda: sum(1 for _ in codec.iter(path)), repeat) * 1000,
+        'size_bytes': len(data),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dataset', required=True, help='directory written by benchmarks.generate_dataset')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--formats', nargs='+', choices=sorted(CODECS), default=sorted(CODECS))
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    codecs = []
+    for name in args.formats:
+        try:
+            codecs.append(get_codec(name))
+        except RuntimeError as e:
+            print(f"Skipping {name}: {e}")
+
+    results = {'dataset': args.dataset, 'repeat': args.repeat, 'collections': {}}
+    work_dir = tempfile.mkdtemp(prefix='serenity-format-bench-')
+    print(f"{'collection':<20}{'format':<14}{'serialize ms':>14}{'parse ms':>12}{'stream ms':>12}{'MB':>10}")
+    try:
+        for collection in COLLECTIONS:
+            path = os.path.join(args.dataset, collection + '.json')
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r') as f:
+                records = json.load(f)
+            results['collections'][collection] = {'records': len(records), 'formats': {}}
+            for codec in codecs:
+                row = bench_codec(codec, records, work_dir, args.repeat)
+                results['collections'][collection]['formats'][codec.name] = row
+                print(f"{collection:<20}{codec.name:<14}{row['serialize_ms']:>14.1f}{row['parse_ms']:>12.1f}"
+                      f"{row['stream_ms']:>12.1f}{row['size_bytes'] / 1e6:>10.2f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
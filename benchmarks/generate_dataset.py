@@ -0,0 +1,261 @@
+"""Synthetic dataset generator for the JSON storage files.
+
+Writes ``users.json``, ``medications.json``, ``medication_logs.json``,
+``health_logs.json`` and ``emergency_contacts.json`` in the same shape that
+``utils/storage.py`` produces, at a chosen scale::
+
+    python -m benchmarks.generate_dataset --scale 100k --output /tmp/serenity-100k
+
+``--scale`` is the approximate total number of records across all files
+(``1k``, ``100k``, ``1m`` or a plain integer). A ``bench_manifest.json`` with
+record counts and sample ids is written next to the data for
+:mod:`benchmarks.storage_bench`.
+"""
+import argparse
+import json
+import os
+import random
+import uuid
+from datetime import datetime, timedelta
+
+SCALES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+
+# Share of the total record count given to each collection
+MIX = {
+    'users': 0.01,
+    'medications': 0.04,
+    'emergency_contacts': 0.02,
+    'health_logs': 0.28,
+    'medication_logs': 0.65,
+}
+
+FREQUENCIES = [
+    ('daily', 0.45),
+    ('twice_daily', 0.2),
+    ('three_times_daily', 0.08),
+    ('four_times_daily', 0.04),
+    ('weekly', 0.13),
+    ('biweekly', 0.05),
+    ('monthly', 0.05),
+]
+DOSES_PER_DAY = {'twice_daily': 2, 'three_times_daily': 3, 'four_times_daily': 4}
+INTERVAL_DAYS = {'weekly': 7, 'biweekly': 14, 'monthly': 30}
+
+MEDICATION_NAMES = ['Lisinopril', 'Metformin', 'Atorvastatin', 'Amlodipine', 'Levothyroxine',
+                    'Omeprazole', 'Aspirin', 'Vitamin D', 'Donepezil', 'Furosemide',
+                    'Warfarin', 'Gabapentin', 'Calcium', 'Sertraline', 'Losartan']
+DOSAGES = ['5mg', '10mg', '20mg', '25mg', '50mg', '100mg', '500mg', '1000 IU']
+FIRST_NAMES = ['Mary', 'John', 'Patricia', 'Robert', 'Linda', 'James', 'Barbara', 'William',
+               'Elizabeth', 'Richard', 'Susan', 'Joseph', 'Margaret', 'Thomas', 'Dorothy']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis',
+              'Wilson', 'Taylor', 'Anderson', 'Thomas', 'Moore', 'Martin', 'Lee']
+RELATIONSHIPS = ['child', 'spouse', 'sibling', 'friend', 'neighbor', 'caregiver', 'doctor']
+MOODS = ['great', 'good', 'okay', 'bad', 'terrible']
+SLEEP = ['poor', 'fair', 'good', 'excellent']
+APPETITE = ['no_appetite', 'normal', 'increased']
+MOBILITY = ['easy', 'slightly_difficult', 'very_difficult']
+BREATHING = ['none', 'mild', 'moderate', 'severe']
+MED_TAKEN = ['yes', 'no', 'missed_one']
+
+SAMPLE_SIZE = 20
+
+
+def write_json_array(path, records):
+    """Stream records to ``path`` in the same layout as ``json.dump(..., indent=2)``"""
+    count = 0
+    with open(path, 'w') as f:
+        f.write('[')
+        for record in records:
+            body = json.dumps(record, indent=2).replace('\n', '\n  ')
+            f.write(('\n  ' if count == 0 else ',\n  ') + body)
+            count += 1
+        f.write('\n]' if count else ']')
+    return count
+
+
+def split(total, parts, rng):
+    """Randomly split ``total`` into ``parts`` non-negative integers"""
+    if parts <= 0:
+        return []
+    weights = [rng.random() + 0.5 for _ in range(parts)]
+    scale = total / sum(weights)
+    counts = [int(w * scale) for w in weights]
+    for i in range(total - sum(counts)):
+        counts[i % parts] += 1
+    return counts
+
+
+class DatasetGenerator:
+    def __init__(self, total, days=180, seed=42):
+        self.rng = random.Random(seed)
+        self.days = days
+        self.now = datetime.now().replace(microsecond=0)
+        self.targets = {name: max(int(total * share), 1) for name, share in MIX.items()}
+        self.users = []
+        self.medications = []
+        self.samples = {}
+
+    def _uuid(self):
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def _past(self, max_days):
+        return self.now - timedelta(seconds=self.rng.randint(0, max_days * 86400))
+
+    def _choice_weighted(self, options):
+        return self.rng.choices([o for o, _ in options], weights=[w for _, w in options])[0]
+
+    def gen_users(self):
+        for i in range(self.targets['users']):
+            first, last = self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+            user = {
+                'id': self._uuid(),
+                'email': f"{first.lower()}.{last.lower()}.{i}@example.com",
+                'name': f"{first} {last}",
+                'profile_picture': None,
+                'created_at': self._past(self.days + 30).isoformat(),
+            }
+            self.users.append({'id': user['id'], 'email': user['email']})
+            yield user
+
+    def gen_medications(self):
+        per_user = split(self.targets['medications'], len(self.users), self.rng)
+        for user, count in zip(self.users, per_user):
+            for _ in range(count):
+                start = (self.now - timedelta(days=self.rng.randint(7, self.days))).date()
+                end = None
+                if self.rng.random() < 0.2:
+                    end = (start + timedelta(days=self.rng.randint(7, 120))).isoformat()
+                med = {
+                    'id': self._uuid(),
+                    'user_id': user['id'],
+                    'name': self.rng.choice(MEDICATION_NAMES),
+                    'dosage': self.rng.choice(DOSAGES),
+                    'frequency': self._choice_weighted(FREQUENCIES),
+                    'time': f"{self.rng.choice([7, 8, 9, 12, 18, 20, 21]):02d}:{self.rng.choice([0, 15, 30]):02d}",
+                    'start_date': f"{start.isoformat()}T00:00:00",
+                    'end_date': f"{end}T00:00:00" if end else None,
+                    'notes': self.rng.choice([None, '', 'Take with food', 'Before bed']),
+                    'created_at': f"{start.isoformat()}T09:00:00",
+                }
+                self.medications.append(med)
+                yield med
+
+    def gen_medication_logs(self):
+        """Consecutive scheduled doses per medication, newest ending a week from now"""
+        per_med = split(self.targets['medication_logs'], len(self.medications), self.rng)
+        for med, count in zip(self.medications, per_med):
+            hour, minute = (int(p) for p in med['time'].split(':'))
+            doses = DOSES_PER_DAY.get(med['frequency'], 1)
+            step = timedelta(days=INTERVAL_DAYS.get(med['frequency'], 1)) / doses
+            first = datetime.combine((self.now + timedelta(days=7)).date(), datetime.min.time()).replace(
+                hour=hour, minute=minute) - step * (count - 1)
+            for i in range(count):
+                scheduled = first + step * i
+                taken = scheduled < self.now and self.rng.random() < 0.85
+                taken_time = (scheduled + timedelta(minutes=self.rng.randint(0, 90))).isoformat() if taken else None
+                yield {
+                    'id': self._uuid(),
+                    'medication_id': med['id'],
+                    'scheduled_time': scheduled.isoformat(),
+                    'taken': taken,
+                    'taken_time': taken_time,
+                    'notes': None,
+                    'user_id': med['user_id'],
+                    'medication_name': med['name'],
+                    'timestamp': (scheduled - timedelta(days=7)).isoformat(),
+                }
+
+    def gen_health_logs(self):
+        per_user = split(self.targets['health_logs'], len(self.users), self.rng)
+        for user, count in zip(self.users, per_user):
+            times = sorted(self._past(self.days) for _ in range(count))
+            for ts in times:
+                yield {
+                    'id': self._uuid(),
+                    'user_id': user['id'],
+                    'mood': self.rng.choice(MOODS),
+                    'pain_level': self.rng.choice([None, self.rng.randint(0, 10)]),
+                    'notes': self.rng.choice(['', '', 'Feeling tired', 'Knee ache', 'Slept well']),
+                    'timestamp': ts.isoformat(),
+                    'energy_level': str(self.rng.randint(0, 10)),
+                    'sleep_quality': self.rng.choice(SLEEP),
+                    'appetite': self.rng.choice(APPETITE),
+                    'mobility': self.rng.choice(MOBILITY),
+                    'heart_rate': self.rng.choice(['', str(int(self.rng.gauss(74, 9)))]),
+                    'breathing_difficulty': self.rng.choice(BREATHING),
+                    'hydration_level': str(self.rng.randint(0, 10)),
+                    'medication_taken': self.rng.choice(MED_TAKEN),
+                    'bowel_movement': None,
+                }
+
+    def gen_emergency_contacts(self):
+        per_user = split(self.targets['emergency_contacts'], len(self.users), self.rng)
+        for user, count in zip(self.users, per_user):
+            for i in range(count):
+                first = self.rng.choice(FIRST_NAMES)
+                yield {
+                    'id': self._uuid(),
+                    'user_id': user['id'],
+                    'name': f"{first} {self.rng.choice(LAST_NAMES)}",
+                    'relationship': self.rng.choice(RELATIONSHIPS),
+                    'phone': f"555{self.rng.randint(1000000, 9999999)}",
+                    'email': self.rng.choice([None, f"{first.lower()}@example.com"]),
+                    'is_primary': i == 0,
+                    'created_at': self._past(self.days).isoformat(),
+                }
+
+    def _sampled(self, name, records):
+        """Pass records through while keeping a reservoir sample of their ids"""
+        sample = self.samples.setdefault(name, [])
+        for i, record in enumerate(records):
+            if len(sample) < SAMPLE_SIZE:
+                sample.append(record['id'])
+            else:
+                j = self.rng.randint(0, i)
+                if j < SAMPLE_SIZE:
+                    sample[j] = record['id']
+            yield record
+
+    def write(self, output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+        counts = {}
+        # Order matters: logs and contacts reference the users and medications generated first
+        for name, gen in [('users', self.gen_users),
+                          ('medications', self.gen_medications),
+                          ('medication_logs', self.gen_medication_logs),
+                          ('health_logs', self.gen_health_logs),
+                          ('emergency_contacts', self.gen_emergency_contacts)]:
+            path = os.path.join(output_dir, f"{name}.json")
+            counts[name] = write_json_array(path, self._sampled(name, gen()))
+            print(f"  {name:<20}{counts[name]:>10} records  {os.path.getsize(path) / 1e6:>9.1f} MB")
+
+        manifest = {
+            'generated_at': self.now.isoformat(),
+            'counts': counts,
+            'sample_ids': self.samples,
+            'sample_emails': [u['email'] for u in self.users[:SAMPLE_SIZE]],
+        }
+        with open(os.path.join(output_dir, 'bench_manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+
+def parse_scale(value):
+    return SCALES.get(value.lower()) or int(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', default='1k', help='1k, 100k, 1m or a record count')
+    parser.add_argument('--output', required=True, help='directory to write the data files into')
+    parser.add_argument('--days', type=int, default=180, help='days of history to spread logs over')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    total = parse_scale(args.scale)
+    print(f"Generating ~{total} records into {args.output}")
+    DatasetGenerator(total, days=args.days, seed=args.seed).write(args.output)
+
+
+if __name__ == '__main__':
+    main()
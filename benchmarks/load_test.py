@@ -0,0 +1,300 @@
+"""Load-testing benchmark for the Serenity Flask app.
+
+Starts gunicorn on ``benchmarks.bench_app:app`` (or uvicorn on
+``benchmarks.bench_asgi:app`` with ``--server asgi``) against a scratch data
+directory, drives the main routes at a fixed concurrency and reports
+p50/p95/p99 latency and requests per second for each route.
+
+Usage::
+
+    python -m benchmarks.load_test --concurrency 16 --requests 400
+    python -m benchmarks.load_test --server asgi --routes api_chat --concurrency 200
+    python -m benchmarks.load_test --save-baseline
+    python -m benchmarks.load_test --baseline benchmarks/baseline.json
+
+Results are written as JSON to ``benchmarks/results/``. When a baseline is
+given the run is compared against it and the process exits with status 1 if
+any route regressed by more than ``--tolerance``.
+"""
+import argparse
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT_DIR, 'benchmarks', 'results')
+DEFAULT_BASELINE = os.path.join(ROOT_DIR, 'benchmarks', 'baseline.json')
+
+ROUTES = ['dashboard', 'medications', 'submit_health_check', 'add_medication',
+          'mark_medication_taken', 'api_chat']
+
+# Chat messages that miss the quick/emergency/knowledge-base shortcuts so they reach the model
+CHAT_MESSAGES = [
+    "is it safe to take vitamin d with my other pills",
+    "recommend a good book for a rainy afternoon",
+    "what should i pack for a weekend trip to the coast",
+    "explain what a pharmacist does",
+]
+
+
+class BenchClient:
+    """One logged-in HTTP session per worker thread"""
+
+    def __init__(self, base_url, index):
+        self.base_url = base_url
+        self.index = index
+        self.session = requests.Session()
+        self.medication_id = None
+
+    def login(self):
+        resp = self.session.post(f"{self.base_url}/_bench/login",
+                                 json={'email': f"bench-{self.index}@example.com",
+                                       'name': f"Bench User {self.index}"})
+        resp.raise_for_status()
+        # Every client needs a medication of its own for mark_medication_taken
+        resp = self._add_medication()
+        resp.raise_for_status()
+        self.medication_id = resp.json()['medication']['id']
+
+    def _add_medication(self):
+        return self.session.post(f"{self.base_url}/add_medication", json={
+            'name': 'Benchmarkol',
+            'dosage': '10mg',
+            'frequency': 'daily',
+            'time': '08:00',
+            'start_date': datetime.now().strftime('%Y-%m-%d'),
+            'notes': 'load test',
+        })
+
+    def call(self, route, i):
+        if route == 'dashboard':
+            return self.session.get(f"{self.base_url}/dashboard")
+        if route == 'medications':
+            return self.session.get(f"{self.base_url}/medications")
+        if route == 'submit_health_check':
+            return self.session.post(f"{self.base_url}/submit_health_check", json={
+                'mood': 'good', 'energy_level': 6, 'sleep_quality': 'good', 'appetite': 'normal',
+                'mobility': 'easy', 'heart_rate': 72, 'breathing': 'normal',
+                'hydration_level': 'good', 'medication_taken': 'yes', 'notes': 'benchmark',
+            })
+        if route == 'add_medication':
+            return self._add_medication()
+        if route == 'mark_medication_taken':
+            # No body, like the dashboard: an unread body stalls gunicorn's gthread keep-alive for 2s
+            return self.session.post(f"{self.base_url}/mark_medication_taken/{self.medication_id}")
+        if route == 'api_chat':
+            return self.session.post(f"{self.base_url}/api/chat",
+                                     json={'message': CHAT_MESSAGES[i % len(CHAT_MESSAGES)]})
+        raise ValueError(f"Unknown route: {route}")
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(pct / 100.0 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, errors, wall_time):
+    latencies.sort()
+    count = len(latencies)
+    return {
+        'requests': count,
+        'errors': errors,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'mean_ms': sum(latencies) / count if count else None,
+        'rps': count / wall_time if wall_time > 0 else None,
+    }
+
+
+def run_route(clients, route, total_requests):
+    """Fire ``total_requests`` at one route spread over all clients"""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    per_client = max(total_requests // len(clients), 1)
+
+    def worker(client):
+        nonlocal errors
+        for i in range(per_client):
+            start = time.perf_counter()
+            try:
+                resp = client.call(route, i)
+                ok = resp.status_code < 400
+            except requests.RequestException:
+                ok = False
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(clients)) as pool:
+        list(pool.map(worker, clients))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+def wait_for_server(base_url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(base_url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not start within {timeout}s")
+
+
+def start_server(args, data_dir):
+    env = dict(os.environ,
+               SERENITY_DATA_DIR=data_dir,
+               BENCH_GEMINI_LATENCY_MS=str(args.gemini_latency_ms),
+               BENCH_GEMINI_JITTER_MS=str(args.gemini_jitter_ms),
+               BENCH_GEMINI_ERROR_RATE=str(args.gemini_error_rate))
+    if args.server == 'asgi':
+        cmd = [sys.executable, '-m', 'uvicorn',
+               '--port', str(args.port),
+               '--log-level', 'warning',
+               'benchmarks.bench_asgi:app']
+    else:
+        cmd = [sys.executable, '-m', 'gunicorn',
+               '--workers', str(args.workers),
+               '--threads', str(args.threads),
+               '--bind', f"127.0.0.1:{args.port}",
+               '--log-level', 'warning',
+               'benchmarks.bench_app:app']
+    return subprocess.Popen(cmd, cwd=ROOT_DIR, env=env,
+                            stdout=subprocess.DEVNULL if not args.verbose else None)
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of human-readable regressions against a baseline run"""
+    regressions = []
+    for route, current in results['routes'].items():
+        previous = baseline.get('routes', {}).get(route)
+        if not previous:
+            continue
+        if previous.get('p95_ms') and current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{route}: p95 {previous['p95_ms']:.1f}ms -> {current['p95_ms']:.1f}ms")
+        if previous.get('rps') and current['rps'] < previous['rps'] * (1 - tolerance):
+            regressions.append(f"{route}: rps {previous['rps']:.1f} -> {current['rps']:.1f}")
+        if current['errors'] > previous.get('errors', 0):
+            regressions.append(f"{route}: errors {previous.get('errors', 0)} -> {current['errors']}")
+    return regressions
+
+
+def print_table(results):
+    print(f"{'route':<24}{'reqs':>7}{'err':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'rps':>10}")
+    for route, r in results['routes'].items():
+        print(f"{route:<24}{r['requests']:>7}{r['errors']:>6}"
+              f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['rps']:>10.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--routes', nargs='+', choices=ROUTES, default=ROUTES)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    parser.add_argument('--server', choices=['wsgi', 'asgi'], default='wsgi',
+                        help='gunicorn (wsgi) or uvicorn on utils.asgi (asgi)')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--url', help='benchmark an already running server instead of starting gunicorn')
+    parser.add_argument('--gemini-latency-ms', type=float, default=800)
+    parser.add_argument('--gemini-jitter-ms', type=float, default=200)
+    parser.add_argument('--gemini-error-rate', type=float, default=0.0, help='fraction of stub calls that fail')
+    parser.add_argument('--output', help='where to write the JSON results')
+    parser.add_argument('--baseline', help='compare against this results file')
+    parser.add_argument('--save-baseline', action='store_true', help=f'also write results to {DEFAULT_BASELINE}')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed relative regression')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    data_dir = tempfile.mkdtemp(prefix='serenity-bench-')
+    server = None
+    base_url = args.url or f"http://127.0.0.1:{args.port}"
+    try:
+        if not args.url:
+            server = start_server(args, data_dir)
+        wait_for_server(base_url)
+
+        clients = [BenchClient(base_url, i) for i in range(args.concurrency)]
+        for client in clients:
+            client.login()
+
+        results = {
+            'timestamp': datetime.now().isoformat(),
+            'config': {
+                'server': args.server,
+                'concurrency': args.concurrency,
+                'requests_per_route': args.requests,
+                'workers': args.workers,
+                'threads': args.threads,
+                'gemini_latency_ms': args.gemini_latency_ms,
+                'gemini_jitter_ms': args.gemini_jitter_ms,
+                'gemini_error_rate': args.gemini_error_rate,
+            },
+            'routes': {},
+        }
+        for route in args.routes:
+            results['routes'][route] = run_route(clients, route, args.requests)
+        # Admission and coalescing counters from the server side of the run
+        results['server_metrics'] = requests.get(f"{base_url}/api/metrics", timeout=5).json()
+    finally:
+        if server:
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                # Background pools (reminders, emergency senders) can hold a worker open
+                server.kill()
+                server.wait()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    print_table(results)
+    # A route that errors is timing its error page, so its numbers mean nothing
+    failing = [route for route, r in results['routes'].items() if r['errors']]
+    if failing:
+        print(f"Routes with errors: {', '.join(failing)}")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(RESULTS_DIR, f"load_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.save_baseline:
+        with open(DEFAULT_BASELINE, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {DEFAULT_BASELINE}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Performance regressions detected:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print("No regressions against baseline")
+    return 1 if failing else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""Memory held by decoded records: plain dicts vs the slotted types in ``utils/records.py``.
+
+For each collection, generates ``--records`` synthetic records, serializes
+them, then measures the Python memory retained after decoding them to dicts
+and after converting those to slotted records, plus decode and full GC time::
+
+    python -m benchmarks.records_bench --records 1000000
+    python -m benchmarks.records_bench --records 100000 --collections health_logs
+
+Memory is traced with ``tracemalloc``, so it counts every object the decoded
+list keeps alive (containers, strings, numbers).
+"""
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+from benchmarks.generate_dataset import DatasetGenerator
+from utils.records import RECORD_TYPES, typed
+from utils.serializers import get_codec
+
+GENERATORS = {
+    'health_logs': 'gen_health_logs',
+    'emergency_contacts': 'gen_emergency_contacts',
+}
+
+
+def serialized(collection, count):
+    """``count`` synthetic records of a collection, compact-JSON encoded"""
+    generator = DatasetGenerator(total=0)
+    generator.targets.update({'users': 1000, collection: count})
+    list(generator.gen_users())
+    records = list(getattr(generator, GENERATORS[collection])())
+    return get_codec('json-compact').dumps(records)
+
+
+def retained(build):
+    """(result, seconds, bytes still allocated once ``build`` returns)"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, current
+
+
+def gc_seconds():
+    start = time.perf_counter()
+    gc.collect()
+    return time.perf_counter() - start
+
+
+def bench_collection(collection, count):
+    codec = get_codec('json-compact')
+    data = serialized(collection, count)
+
+    dicts, parse_seconds, dict_bytes = retained(lambda: codec.loads(data))
+    dict_gc = gc_seconds()
+    start = time.perf_counter()
+    list(typed(collection, dicts))
+    convert_seconds = time.perf_counter() - start
+    del dicts
+
+    # The decoded dicts are garbage by the time build returns, so only records stay traced
+    records, _, record_bytes = retained(lambda: list(typed(collection, codec.loads(data))))
+    record_gc = gc_seconds()
+    del records
+
+    return {
+        'records': count,
+        'dict_bytes_per_record': dict_bytes / count,
+        'record_bytes_per_record': record_bytes / count,
+        'saved_bytes_per_record': (dict_bytes - record_bytes) / count,
+        'dict_total_mb': dict_bytes / 1e6,
+        'record_total_mb': record_bytes / 1e6,
+        'parse_ms': parse_seconds * 1000,
+        'to_records_ms': convert_seconds * 1000,
+        'gc_dicts_ms': dict_gc * 1000,
+        'gc_records_ms': record_gc * 1000,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=1_000_000)
+    parser.add_argument('--collections', nargs='+', choices=sorted(RECORD_TYPES), default=sorted(RECORD_TYPES))
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    results = {'records': args.records, 'collections': {}}
+    print(f"{'collection':<20}{'dict B/rec':>12}{'slots B/rec':>13}{'saved':>8}"
+          f"{'parse ms':>10}{'convert ms':>12}{'gc dict ms':>12}{'gc rec ms':>11}")
+    for collection in args.collections:
+        row = bench_collection(collection, args.records)
+        results['collections'][collection] = row
+        saved = row['saved_bytes_per_record'] / row['dict_bytes_per_record']
+        print(f"{collection:<20}{row['dict_bytes_per_record']:>12.0f}{row['record_bytes_per_record']:>13.0f}"
+              f"{saved:>8.0%}{row['parse_ms']:>10.0f}{row['to_records_ms']:>12.0f}"
+              f"{row['gc_dicts_ms']:>12.1f}{row['gc_records_ms']:>11.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
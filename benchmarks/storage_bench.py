@@ -0,0 +1,148 @@
+"""Microbenchmarks for every function in ``utils/storage.py``.
+
+Copies a dataset produced by :mod:`benchmarks.generate_dataset` into a scratch
+directory, points storage at it through ``SERENITY_DATA_DIR`` and reports
+wall time and peak Python memory for each operation::
+
+    python -m benchmarks.generate_dataset --scale 100k --output /tmp/serenity-100k
+    python -m benchmarks.storage_bench --dataset /tmp/serenity-100k --repeat 5
+    python -m benchmarks.storage_bench --dataset /tmp/serenity-100k --layout sharded
+
+Time is the median over ``--repeat`` runs. Peak memory comes from one extra
+run under ``tracemalloc`` so tracing overhead does not distort the timings.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+
+def measure(fn, repeat):
+    """Return (median seconds, peak bytes) for ``fn(i)`` called ``repeat`` times"""
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn(i)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn(repeat)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings), peak
+
+
+def sample_owners(dataset, manifest, reserve):
+    """user_id for each sampled medication and contact, so lookups can name the owner.
+
+    Also reserves ``reserve`` other ids per collection for the delete cases,
+    which remove one record per run. Returns (owners, {collection: reserved ids}).
+    """
+    owners = {}
+    reserved = {}
+    for collection in ('medications', 'emergency_contacts'):
+        wanted = set(manifest['sample_ids'][collection])
+        reserved[collection] = []
+        with open(os.path.join(dataset, f'{collection}.json'), 'r') as f:
+            for record in json.load(f):
+                if record['id'] in wanted:
+                    owners[record['id']] = record['user_id']
+                elif len(reserved[collection]) < reserve:
+                    owners[record['id']] = record['user_id']
+                    reserved[collection].append(record['id'])
+        if len(reserved[collection]) < reserve:
+            raise SystemExit(f"{collection}: the delete case needs {reserve} records besides the sampled ones "
+                             f"but the dataset has only {len(reserved[collection])}; lower --repeat")
+    return owners, reserved
+
+
+def build_cases(storage, manifest, owners, reserved):
+    """Benchmark cases in run order: reads, then appends, then deletes"""
+    samples = manifest['sample_ids']
+    user_ids = samples['users']
+    med_ids = samples['medications']
+    deletable_meds = reserved['medications']
+    deletable_contacts = reserved['emergency_contacts']
+    emails = manifest['sample_emails']
+    now = datetime.now()
+
+    def pick(ids, i):
+        return ids[i % len(ids)]
+
+    return [
+        ('User.get', lambda i: storage.User.get(pick(user_ids, i))),
+        ('User.find_by_email', lambda i: storage.User.find_by_email(pick(emails, i))),
+        ('User.get_medications', lambda i: storage.User.get(pick(user_ids, i)).get_medications()),
+        ('User.get_emergency_contacts', lambda i: storage.User.get(pick(user_ids, i)).get_emergency_contacts()),
+        ('get_medication', lambda i: storage.get_medication(pick(med_ids, i), owners[pick(med_ids, i)])),
+        ('get_medication_logs', lambda i: storage.get_medication_logs(
+            pick(med_ids, i), limit=20, user_id=owners[pick(med_ids, i)])),
+        ('get_recent_health_logs', lambda i: storage.get_recent_health_logs(pick(user_ids, i), limit=10)),
+        ('User.create', lambda i: storage.User.create(f"bench-{i}-{time.time_ns()}@example.com", 'Bench User')),
+        ('add_medication', lambda i: storage.add_medication(
+            pick(user_ids, i), 'Benchmarkol', '10mg', 'daily', '08:00', now)),
+        ('add_medication_log', lambda i: storage.add_medication_log(
+            medication_id=pick(med_ids, i), scheduled_time=now.isoformat(), taken=False,
+            user_id=owners[pick(med_ids, i)])),
+        ('add_health_log', lambda i: storage.add_health_log(
+            pick(user_ids, i), 'good', pain_level=2, energy_level='6', heart_rate='72')),
+        ('add_emergency_contact', lambda i: storage.add_emergency_contact(
+            pick(user_ids, i), 'Bench Contact', 'friend', '5550000000', is_primary=True)),
+        # Deletes consume a distinct reserved id per run (repeat + 1 of them) so every call removes a real record
+        ('delete_medication', lambda i: storage.delete_medication(deletable_meds[i], owners[deletable_meds[i]])),
+        ('delete_emergency_contact', lambda i: storage.delete_emergency_contact(
+            deletable_contacts[i], owners[deletable_contacts[i]])),
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dataset', required=True, help='directory written by benchmarks.generate_dataset')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--layout', choices=['global', 'sharded'], default='global')
+    parser.add_argument('--only', nargs='+', help='run only these operations')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    with open(os.path.join(args.dataset, 'bench_manifest.json'), 'r') as f:
+        manifest = json.load(f)
+
+    work_dir = tempfile.mkdtemp(prefix='serenity-storage-bench-')
+    shutil.copytree(args.dataset, work_dir, dirs_exist_ok=True)
+    if args.layout == 'sharded':
+        from utils.convert_storage import COLLECTIONS, shard_collections
+        shard_collections(work_dir, COLLECTIONS)
+    # Storage resolves its paths and layout at import time
+    os.environ['SERENITY_DATA_DIR'] = work_dir
+    os.environ['STORAGE_LAYOUT'] = args.layout
+    from utils import storage
+
+    # measure() calls each case repeat times plus once under tracemalloc
+    owners, reserved = sample_owners(args.dataset, manifest, args.repeat + 1)
+    results = {'dataset': args.dataset, 'layout': args.layout, 'counts': manifest['counts'],
+               'repeat': args.repeat, 'operations': {}}
+    print(f"{'operation':<30}{'median ms':>12}{'peak MB':>12}")
+    try:
+        for name, fn in build_cases(storage, manifest, owners, reserved):
+            if args.only and name not in args.only:
+                continue
+            seconds, peak = measure(fn, args.repeat)
+            results['operations'][name] = {'median_ms': seconds * 1000, 'peak_bytes': peak}
+            print(f"{name:<30}{seconds * 1000:>12.2f}{peak / 1e6:>12.2f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
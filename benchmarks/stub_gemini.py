@@ -0,0 +1,59 @@
+"""Local stand-in for the Gemini model used by the benchmarks.
+
+The stub mimics the small part of ``google.generativeai`` that ``utils/app.py``
+touches (``configure`` and ``GenerativeModel.generate_content[_async]``) and sleeps for
+a configurable amount of time instead of calling the network. It can also
+fail a configurable fraction of calls, which is how the timeout and circuit
+breaker paths around the Gemini call are exercised locally.
+"""
+import asyncio
+import random
+import time
+
+
+class StubUpstreamError(Exception):
+    """Injected failure standing in for a Gemini API error"""
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubGenerativeModel:
+    """Drop-in replacement for ``genai.GenerativeModel`` with injected latency and errors"""
+
+    latency_ms = 800
+    jitter_ms = 200
+    error_rate = 0.0
+
+    ANSWER = "This is a stubbed health answer. Please consult your doctor for medical advice."
+
+    def __init__(self, model_name=None, **kwargs):
+        self.model_name = model_name
+
+    def _delay(self):
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        return max(delay, 0) / 1000.0
+
+    def generate_content(self, prompt, generation_config=None, safety_settings=None, **kwargs):
+        time.sleep(self._delay())
+        if random.random() < self.error_rate:
+            raise StubUpstreamError("503 Service Unavailable (injected by stub)")
+        return StubResponse(self.ANSWER)
+
+    async def generate_content_async(self, prompt, generation_config=None, safety_settings=None, **kwargs):
+        await asyncio.sleep(self._delay())
+        if random.random() < self.error_rate:
+            raise StubUpstreamError("503 Service Unavailable (injected by stub)")
+        return StubResponse(self.ANSWER)
+
+
+def install_stub(genai_module, latency_ms=800, jitter_ms=200, error_rate=0.0):
+    """Patch a ``google.generativeai`` module so every model is a stub"""
+    StubGenerativeModel.latency_ms = latency_ms
+    StubGenerativeModel.jitter_ms = jitter_ms
+    StubGenerativeModel.error_rate = error_rate
+    genai_module.GenerativeModel = StubGenerativeModel
+    genai_module.configure = lambda **kwargs: None
+    return StubGenerativeModel
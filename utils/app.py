@@ -3,9 +3,9 @@ import json
 from datetime import datetime, timedelta
 import random
 import time
-import hashlib
+import secrets
 import threading
-from flask import Flask, render_template, redirect, url_for, request, flash, jsonify, session
+from flask import Flask, render_template, redirect, url_for, request, flash, jsonify, session, Response, stream_with_context
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_session import Session as FlaskSession
 from authlib.integrations.flask_client import OAuth
@@ -13,7 +13,15 @@ import google.generativeai as genai
 from dotenv import load_dotenv
 from utils.storage import User, add_medication, get_medication, add_medication_log, get_medication_logs
 from utils.storage import add_health_log, get_recent_health_logs, add_emergency_contact, delete_medication, HEALTH_TIPS
-from utils.storage import delete_emergency_contact
+from utils.storage import delete_emergency_contact, mark_doses_taken
+from utils.singleflight import SingleFlight, AsyncSingleFlight, normalize_prompt
+from utils.upstream import UpstreamGuard, AsyncUpstreamGuard, CircuitBreaker, UpstreamUnavailable
+from utils.knowledge_base import KnowledgeBase
+from utils.chat_memory import ChatMemory
+from utils.user_data import COLLECTIONS, export_ndjson, export_csv, import_records
+from utils.emergency import create_dispatcher
+from utils.reminders import create_reminder_service
+from utils.health_stats import HealthStats
 
 load_dotenv()
 
@@ -84,7 +92,102 @@ HEALTH_KNOWLEDGE = {
     }
 }
 
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 1024,
+}
+
+SAFETY_SETTINGS = [
+    {
+        "category": "HARM_CATEGORY_HARASSMENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_HATE_SPEECH",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    }
+]
+
+# Local FAQ retrieval answers confident matches without calling Gemini. A direct
+# answer needs high confidence and, for longer questions, at least two matched
+# terms, so a medication question that merely shares words with an FAQ entry
+# still goes to Gemini.
+knowledge_base = KnowledgeBase.from_file()
+KNOWLEDGE_BASE_THRESHOLD = float(os.getenv('KNOWLEDGE_BASE_THRESHOLD', '0.7'))
+KNOWLEDGE_BASE_MIN_TERMS = int(os.getenv('KNOWLEDGE_BASE_MIN_TERMS', '2'))
+KNOWLEDGE_BASE_FALLBACK_THRESHOLD = float(os.getenv('KNOWLEDGE_BASE_FALLBACK_THRESHOLD', '0.25'))
+
+CHAT_SYSTEM_PROMPT = (
+    "You are a helpful health assistant for seniors. Give clear, concise and compassionate answers, "
+    "and remind users to consult healthcare professionals for medical advice."
+)
+
+# Bounded multi-turn context per chat session, keyed by chat_session_id(). The memory lives in
+# each process: with several gunicorn workers, a follow-up that lands on another worker has no context.
+chat_memory = ChatMemory(
+    max_sessions=int(os.getenv('CHAT_MEMORY_MAX_SESSIONS', '1000')),
+    max_turns=int(os.getenv('CHAT_MEMORY_MAX_TURNS', '6')),
+    max_tokens=int(os.getenv('CHAT_MEMORY_MAX_TOKENS', '600')),
+    idle_timeout=float(os.getenv('CHAT_MEMORY_IDLE_SECONDS', '1800'))
+)
+
+# Emergency alerts go to the user's primary contact through these channels (file, desktop)
+emergency_dispatcher = create_dispatcher(
+    os.getenv('EMERGENCY_CHANNELS', 'file').split(','),
+    workers=int(os.getenv('EMERGENCY_WORKERS', '2')),
+    sla_seconds=float(os.getenv('EMERGENCY_SLA_SECONDS', '2'))
+)
+
+# Medication reminders fire at each scheduled dose (notifiers: stub, desktop, speech).
+# Off unless REMINDERS_ENABLED=1: every process that enables them fires every
+# reminder, so with several gunicorn workers set it for one process only, or run
+# `python -m utils.reminders` instead. Either way the service re-reads medications
+# changed through other processes every REMINDER_SYNC_SECONDS and before firing.
+reminder_service = None
+if os.getenv('REMINDERS_ENABLED', '0') == '1':
+    reminder_service = create_reminder_service(
+        os.getenv('REMINDER_NOTIFIERS', 'stub').split(','),
+        sync_interval=float(os.getenv('REMINDER_SYNC_SECONDS', '60'))
+    )
+
+# Running per-user health statistics, so unusual readings are flagged as they are submitted.
+# Kept in step with the health logs files, so logs stored through other workers count too.
+health_stats = HealthStats(
+    alpha=float(os.getenv('HEALTH_EWMA_ALPHA', '0.1')),
+    z_threshold=float(os.getenv('HEALTH_ANOMALY_Z', '3')),
+    min_samples=int(os.getenv('HEALTH_ANOMALY_MIN_SAMPLES', '5'))
+)
+health_stats.rebuild()
+
 pending_responses = {}
+gemini_flight = SingleFlight()
+gemini_guard = UpstreamGuard(
+    max_concurrent=int(os.getenv('GEMINI_MAX_CONCURRENCY', '4')),
+    queue_timeout=float(os.getenv('GEMINI_QUEUE_TIMEOUT', '2')),
+    call_timeout=float(os.getenv('GEMINI_TIMEOUT', '15')),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.getenv('GEMINI_BREAKER_FAILURES', '5')),
+        reset_timeout=float(os.getenv('GEMINI_BREAKER_RESET', '30'))
+    )
+)
+# Used by the ASGI server; shares the breaker so both paths agree on upstream health
+async_gemini_flight = AsyncSingleFlight()
+async_gemini_guard = AsyncUpstreamGuard(
+    max_concurrent=int(os.getenv('GEMINI_MAX_CONCURRENCY_ASYNC', '64')),
+    queue_timeout=gemini_guard.queue_timeout,
+    call_timeout=gemini_guard.call_timeout,
+    breaker=gemini_guard.breaker
+)
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -154,11 +257,13 @@ def dashboard():
             log['timestamp'] = datetime.fromisoformat(log['timestamp'])
     
     daily_tip = get_daily_tip()
+    health_alerts = health_stats.alerts(current_user.id, since=(today - timedelta(days=7)).isoformat())
     
     return render_template('dashboard.html',
                           now=today,
                           medications=today_meds,
                           health_logs=health_logs,
+                          health_alerts=health_alerts,
                           daily_tip=daily_tip)
 
 @app.route('/medications')
@@ -204,7 +309,9 @@ def add_medication_route():
             if new_medication.get('end_date') and isinstance(new_medication['end_date'], datetime):
                 new_medication['end_date'] = new_medication['end_date'].isoformat()
                 
-            create_medication_logs(new_medication)
+            scheduled_logs = create_medication_logs(new_medication)
+            if reminder_service:
+                reminder_service.schedule_medication(new_medication, scheduled_logs)
             return jsonify({'success': True, 'medication': new_medication})
         else:
             return jsonify({'success': False, 'error': 'Failed to add medication'}), 500
@@ -217,7 +324,7 @@ def add_medication_route():
 @login_required
 def delete_medication_route(medication_id):
     try:
-        medication = get_medication(medication_id)
+        medication = get_medication(medication_id, current_user.id)
         
         if not medication:
             return jsonify({'success': False, 'error': 'Medication not found'}), 404
@@ -225,9 +332,11 @@ def delete_medication_route(medication_id):
         if medication['user_id'] != current_user.id:
             return jsonify({'success': False, 'error': 'Not authorized to delete this medication'}), 403
         
-        deleted_medication = delete_medication(medication_id)
+        deleted_medication = delete_medication(medication_id, current_user.id)
         
         if deleted_medication:
+            if reminder_service:
+                reminder_service.cancel_medication(medication_id)
             return jsonify({'success': True})
         else:
             return jsonify({'success': False, 'error': 'Failed to delete medication'}), 500
@@ -240,26 +349,48 @@ def delete_medication_route(medication_id):
 @login_required
 def mark_medication_taken(medication_id):
     try:
-        medication = get_medication(medication_id)
+        medication = get_medication(medication_id, current_user.id)
         
         if not medication:
             return jsonify({'success': False, 'error': 'Medication not found'}), 404
             
-        now = datetime.now()
-        add_medication_log(
-            user_id=current_user.id,
-            medication_id=medication_id,
-            medication_name=medication['name'],
-            taken=True,
-            timestamp=now.isoformat(),
-            notes="Marked as taken via dashboard"
-        )
+        log = take_doses([medication])[0]
         
-        return jsonify({'success': True})
+        return jsonify({'success': True, 'log': log})
     except Exception as e:
         app.logger.error(f"Error marking medication as taken: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/mark_medications_taken', methods=['POST'])
+@login_required
+def mark_medications_taken():
+    # Dashboard batch: mark several medications taken with a single storage write
+    try:
+        data = request.get_json(silent=True)
+        medication_ids = data.get('medication_ids') if isinstance(data, dict) else None
+        if not isinstance(medication_ids, list) or not all(isinstance(med_id, str) for med_id in medication_ids):
+            return jsonify({'success': False, 'error': 'medication_ids must be an array of ids'}), 400
+        medications_by_id = {med['id']: med for med in current_user.get_medications()}
+        medications = [medications_by_id[med_id] for med_id in medication_ids if med_id in medications_by_id]
+        not_found = [med_id for med_id in medication_ids if med_id not in medications_by_id]
+        
+        logs = take_doses(medications) if medications else []
+        
+        return jsonify({'success': True, 'logs': logs, 'not_found': not_found})
+    except Exception as e:
+        app.logger.error(f"Error marking medications as taken: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def take_doses(medications):
+    """Mark each medication's scheduled dose nearest now taken, in one storage write"""
+    logs = mark_doses_taken(medications, current_user.id, taken_time=datetime.now().isoformat(),
+                            notes="Marked as taken via dashboard")
+    if reminder_service:
+        for log in logs:
+            if log['scheduled_time']:
+                reminder_service.cancel_dose(log['id'])
+    return logs
+
 @app.route('/health_check')
 @login_required
 def health_check():
@@ -291,9 +422,10 @@ def submit_health_check():
             "notes": data.get('notes')
         }
         
-        add_health_log(
+        new_log = add_health_log(
             user_id=current_user.id,
             mood=data.get('mood'),
+            pain_level=data.get('pain_level'),
             energy_level=data.get('energy_level'),
             sleep_quality=data.get('sleep_quality'),
             appetite=data.get('appetite'),
@@ -304,8 +436,9 @@ def submit_health_check():
             medication_taken=data.get('medication_taken'),
             notes=data.get('notes')
         )
+        alerts = health_stats.observe(new_log)
         
-        return jsonify({"success": True})
+        return jsonify({"success": True, "alerts": alerts})
     except Exception as e:
         app.logger.error(f"Error submitting health check: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
@@ -343,7 +476,7 @@ def delete_emergency_contact_route(contact_id):
         if not any(contact['id'] == contact_id for contact in contacts):
             return jsonify({'success': False, 'error': 'Not authorized to delete this contact'}), 403
         
-        deleted_contact = delete_emergency_contact(contact_id)
+        deleted_contact = delete_emergency_contact(contact_id, current_user.id)
         
         if deleted_contact:
             return jsonify({'success': True})
@@ -354,8 +487,93 @@ def delete_emergency_contact_route(contact_id):
         app.logger.error(f"Error deleting emergency contact: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/health_logs', methods=['GET'])
+@login_required
+def health_logs_page():
+    # Cursor pagination: pass the last id of one page as ?before= to get the next
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), 100))
+        logs = get_recent_health_logs(current_user.id, limit=limit, before=request.args.get('before'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    next_before = logs[-1]['id'] if len(logs) == limit else None
+    return jsonify({'success': True, 'logs': logs, 'next_before': next_before})
+
+@app.route('/api/health_stats', methods=['GET'])
+@login_required
+def health_stats_summary():
+    return jsonify({
+        'success': True,
+        'stats': health_stats.summary(current_user.id),
+        'alerts': health_stats.alerts(current_user.id, since=request.args.get('since'))
+    })
+
+@app.route('/api/export', methods=['GET'])
+@login_required
+def export_data():
+    export_format = request.args.get('format', 'ndjson')
+    user_id = current_user.id
+    
+    if export_format == 'csv':
+        collection = request.args.get('collection', 'health_logs')
+        if collection not in COLLECTIONS:
+            return jsonify({'success': False, 'error': f'Unknown collection: {collection}'}), 400
+        body = export_csv(user_id, collection)
+        mimetype = 'text/csv'
+        filename = f"serenity_{collection}.csv"
+    elif export_format == 'ndjson':
+        collections = request.args.get('collections')
+        collections = collections.split(',') if collections else COLLECTIONS
+        unknown = [c for c in collections if c not in COLLECTIONS]
+        if unknown:
+            return jsonify({'success': False, 'error': f"Unknown collection: {', '.join(unknown)}"}), 400
+        body = export_ndjson(user_id, collections)
+        mimetype = 'application/x-ndjson'
+        filename = 'serenity_export.ndjson'
+    else:
+        return jsonify({'success': False, 'error': 'format must be ndjson or csv'}), 400
+    
+    # Records are read and sent one at a time, so memory stays flat however long the history is
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.route('/api/import', methods=['POST'])
+@login_required
+def import_data():
+    try:
+        if request.is_json:
+            data = request.get_json()
+            records = data.get('records', []) if isinstance(data, dict) else data
+            if not isinstance(records, list):
+                return jsonify({'success': False, 'error': 'records must be a JSON array'}), 400
+            lines = (json.dumps(record) for record in records)
+        else:
+            # NDJSON body, read line by line from the request stream
+            lines = request.stream
+        
+        result = import_records(current_user.id, lines)
+        if result['imported']['health_logs']:
+            health_stats.rebuild_user(current_user.id)
+        return jsonify({'success': True, **result})
+    except Exception as e:
+        app.logger.error(f"Error importing data: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
+    session_id, user_message = read_chat_request()
+    
+    reply = local_chat_reply(session_id, user_message)
+    if reply:
+        return jsonify(reply)
+    
+    print("No quick/emergency/health matches, proceeding to Gemini API")
+    prompt = build_chat_prompt(session_id, user_message)
+    return jsonify(gemini_chat_reply(session_id, user_message, prompt))
+
+def read_chat_request():
+    """Session id and lower-cased message for the current chat request"""
     print("==== API CHAT ENDPOINT HIT ====")
     print(f"Request: Method={request.method}, ContentType={request.content_type}, JSON={request.is_json}")
     
@@ -366,22 +584,29 @@ def chat():
     except Exception as e:
         print(f"Error parsing request data: {e}")
     
-    if '_id' not in session:
-        print("No session ID found - creating a new session ID")
-        session['_id'] = hashlib.md5(os.urandom(16)).hexdigest()
-        
-    session_id = session.get('_id')
+    session_id = chat_session_id()
     print(f"Session ID: {session_id}")
     
     data = request.get_json() if request.is_json else {}
     user_message = data.get('message', '').lower() if data else ''
     print(f"Received message: {user_message}")
-    
-    for keyword, response in QUICK_RESPONSES.items():
-        if keyword in user_message:
-            print(f"Quick response matched: {keyword}")
-            return jsonify({'response': response, 'is_emergency': False})
-    
+    return session_id, user_message
+
+def chat_session_id():
+    """Key for the caller's chat memory: the user id when logged in, else a random id kept in the session.
+
+    Never Flask-Login's session['_id'], which is a hash of the client's IP address
+    and User-Agent and so is shared by users behind the same proxy or NAT.
+    """
+    if current_user.is_authenticated:
+        return f"user:{current_user.id}"
+    if 'chat_id' not in session:
+        print("No chat session ID found - creating a new one")
+        session['chat_id'] = secrets.token_hex(16)
+    return session['chat_id']
+
+def local_chat_reply(session_id, user_message):
+    """Reply from emergency handling, quick responses or local knowledge, or None to ask Gemini"""
     emergency_keywords = ['emergency', 'help me', 'severe pain', 'chest pain', 'can\'t breathe', 
                          'heart attack', 'stroke', 'bleeding', 'unconscious', 'fell and can\'t get up']
     
@@ -392,100 +617,157 @@ def chat():
                 "⚠️ This sounds like an emergency! Please call 911 or your local emergency number immediately. "
                 "Don't wait for a response here."
             )
-            return jsonify({'response': emergency_response, 'is_emergency': True})
+            alert = None
+            if current_user.is_authenticated:
+                alert = emergency_dispatcher.dispatch(
+                    current_user.id,
+                    f"{current_user.name} may be having an emergency. They wrote: \"{user_message[:200]}\""
+                )
+            if alert:
+                emergency_response += f" I've also alerted your emergency contact, {alert['contact_name']}."
+            return {'response': emergency_response, 'is_emergency': True, 'contact_notified': bool(alert)}
+    
+    # After the emergency check, so "help me" or "this is an emergency" can't match "help" or "hi"
+    for keyword, response in QUICK_RESPONSES.items():
+        if keyword in user_message:
+            print(f"Quick response matched: {keyword}")
+            return {'response': response, 'is_emergency': False}
     
     for condition, info in HEALTH_KNOWLEDGE.items():
         if condition in user_message or (condition == "headache" and "medicine for headache" in user_message):
             print(f"Health knowledge matched: {condition}")
             response = f"{info['advice']} Common medications include: {', '.join(info['medications'])}."
-            return jsonify({'response': response, 'is_emergency': False})
+            chat_memory.add_exchange(session_id, user_message, response)
+            return {'response': response, 'is_emergency': False}
     
-    print("No quick/emergency/health matches, proceeding to Gemini API")
+    kb_match = knowledge_base.best_answer(user_message, KNOWLEDGE_BASE_THRESHOLD, KNOWLEDGE_BASE_MIN_TERMS)
+    if kb_match:
+        print(f"Knowledge base matched: {kb_match['entry']['id']} (confidence {kb_match['confidence']:.2f})")
+        chat_memory.add_exchange(session_id, user_message, kb_match['entry']['answer'])
+        return {'response': kb_match['entry']['answer'], 'is_emergency': False, 'source': 'knowledge_base'}
     
+    return None
+
+def gemini_chat_reply(session_id, user_message, prompt):
     try:
-        print("Initializing Gemini model...")
-        api_key = os.getenv("GEMINI_API_KEY")
-        print(f"API key available: {bool(api_key)} (Key starts with: {api_key[:4] if api_key else 'None'}...)")
-        
-        genai.configure(api_key=api_key)
-        
-        model = genai.GenerativeModel('models/gemini-2.0-flash')
-        print(f"Using model: models/gemini-2.0-flash")
-        
-        prompt = f"""You are a helpful health assistant for seniors. 
-        Please provide a clear, concise, and compassionate response to the following question.
-        Focus on providing accurate health information, but always remind users to consult healthcare professionals for medical advice.
-        
-        User question: {user_message}
-        """
-        
-        generation_config = {
-            "temperature": 0.7,
-            "top_p": 0.95,
-            "top_k": 40,
-            "max_output_tokens": 1024,
-        }
-        
-        safety_settings = [
-            {
-                "category": "HARM_CATEGORY_HARASSMENT",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            },
-            {
-                "category": "HARM_CATEGORY_HATE_SPEECH",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            },
-            {
-                "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            },
-            {
-                "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            }
-        ]
-        
-        print("Sending request to Gemini API...")
-        try:
-            response = model.generate_content(
-                prompt,
-                generation_config=generation_config,
-                safety_settings=safety_settings
-            )
-            print("Gemini API response received successfully")
-            response_text = response.text
-            print(f"Response first 50 chars: {response_text[:50]}...")
-            
-            return jsonify({'response': response_text, 'is_emergency': False})
-            
-        except Exception as api_error:
-            print(f"Error during API call: {api_error}")
-            return jsonify({
-                'response': f"I'm sorry, I couldn't process your request due to an API error: {str(api_error)[:100]}...",
-                'is_emergency': False,
-                'error': True
-            })
+        # Identical prompts (same question, same context) asked at the same moment share a single upstream call
+        response_text = gemini_flight.do(normalize_prompt(prompt),
+                                         lambda: gemini_guard.call(lambda: generate_ai_response(prompt)))
+    except UpstreamUnavailable as unavailable:
+        return upstream_unavailable_reply(user_message, unavailable)
+    except Exception as api_error:
+        return api_error_reply(api_error)
     
-    except Exception as e:
-        print(f"ERROR generating AI response: {e}")
-        print(f"Error type: {type(e).__name__}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
-        
-        return jsonify({
-            'response': "I'm sorry, I couldn't process your request at this time. Please try again later.",
-            'is_emergency': False,
-            'error': True
-        })
+    chat_memory.add_exchange(session_id, user_message, response_text)
+    return {'response': response_text, 'is_emergency': False}
+
+async def gemini_chat_reply_async(session_id, user_message, prompt):
+    """Non-blocking counterpart of gemini_chat_reply for the ASGI server (utils/asgi.py)"""
+    try:
+        response_text = await async_gemini_flight.do(
+            normalize_prompt(prompt),
+            lambda: async_gemini_guard.call(lambda: generate_ai_response_async(prompt))
+        )
+    except UpstreamUnavailable as unavailable:
+        return upstream_unavailable_reply(user_message, unavailable)
+    except Exception as api_error:
+        return api_error_reply(api_error)
+    
+    chat_memory.add_exchange(session_id, user_message, response_text)
+    return {'response': response_text, 'is_emergency': False}
+
+def upstream_unavailable_reply(user_message, unavailable):
+    print(f"Gemini unavailable ({unavailable.reason}), answering locally")
+    return {'response': local_fallback_response(user_message), 'is_emergency': False, 'fallback': True}
+
+def api_error_reply(api_error):
+    print(f"Error during API call: {api_error}")
+    print(f"Error type: {type(api_error).__name__}")
+    return {
+        'response': f"I'm sorry, I couldn't process your request due to an API error: {str(api_error)[:100]}...",
+        'is_emergency': False,
+        'error': True
+    }
+
+def local_fallback_response(user_message):
+    """Best local answer when Gemini is too slow or unhealthy to ask"""
+    # Health knowledge was already tried by local_chat_reply before Gemini
+    kb_match = knowledge_base.best_answer(user_message, KNOWLEDGE_BASE_FALLBACK_THRESHOLD)
+    if kb_match:
+        return kb_match['entry']['answer']
+    
+    return (
+        "I'm having trouble reaching my health knowledge service right now, so I can't fully answer that. "
+        f"{QUICK_RESPONSES['help']} For anything urgent, please contact your doctor or call 911."
+    )
+
+def build_chat_prompt(session_id, user_message):
+    """Short system prompt plus the session's bounded history and the new question"""
+    history = chat_memory.format_history(session_id)
+    if history:
+        return f"{CHAT_SYSTEM_PROMPT}\n\nConversation so far:\n{history}\n\nUser question: {user_message}"
+    return f"{CHAT_SYSTEM_PROMPT}\n\nUser question: {user_message}"
+
+def get_gemini_model():
+    print("Initializing Gemini model...")
+    api_key = os.getenv("GEMINI_API_KEY")
+    print(f"API key available: {bool(api_key)} (Key starts with: {api_key[:4] if api_key else 'None'}...)")
+    
+    genai.configure(api_key=api_key)
+    
+    model = genai.GenerativeModel('models/gemini-2.0-flash')
+    print(f"Using model: models/gemini-2.0-flash")
+    return model
+
+def generate_ai_response(prompt):
+    model = get_gemini_model()
+    
+    print("Sending request to Gemini API...")
+    response = model.generate_content(
+        prompt,
+        generation_config=GENERATION_CONFIG,
+        safety_settings=SAFETY_SETTINGS
+    )
+    print("Gemini API response received successfully")
+    response_text = response.text
+    print(f"Response first 50 chars: {response_text[:50]}...")
+    return response_text
+
+async def generate_ai_response_async(prompt):
+    model = get_gemini_model()
+    
+    print("Sending async request to Gemini API...")
+    response = await model.generate_content_async(
+        prompt,
+        generation_config=GENERATION_CONFIG,
+        safety_settings=SAFETY_SETTINGS
+    )
+    print("Gemini API response received successfully")
+    return response.text
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    return jsonify({
+        'gemini_singleflight': gemini_flight.metrics(),
+        'gemini_admission': gemini_guard.metrics(),
+        'gemini_singleflight_async': async_gemini_flight.metrics(),
+        'gemini_admission_async': async_gemini_guard.metrics(),
+        'chat_memory': chat_memory.metrics(),
+        'emergency_dispatch': emergency_dispatcher.metrics(),
+        'reminders': reminder_service.metrics() if reminder_service else None,
+        'health_stats': health_stats.metrics()
+    })
 
 @app.route('/api/check_pending_response', methods=['GET'])
 def check_pending_response():
-    session_id = session.get('_id')
+    return jsonify(pending_response_payload(session.get('_id')))
+
+def pending_response_payload(session_id):
     if not session_id or session_id not in pending_responses:
-        return jsonify({
+        return {
             'status': 'error',
             'response': 'No pending response found'
-        })
+        }
     
     response_data = pending_responses[session_id]
     
@@ -496,9 +778,9 @@ def check_pending_response():
             timestamp = datetime.fromisoformat(pending_responses[sess_id]['timestamp'])
             if timestamp < cleanup_time:
                 del pending_responses[sess_id]
-        return jsonify(response_to_return)
+        return response_to_return
     
-    return jsonify(response_data)
+    return response_data
 
 def is_medication_due_today(medication):
     today = datetime.now().date()
@@ -530,6 +812,7 @@ def is_medication_due_today(medication):
 def create_medication_logs(medication):
     today = datetime.now().date()
     medication_id = medication['id']
+    logs = []
     
     for i in range(7):
         check_date = today + timedelta(days=i)
@@ -548,11 +831,12 @@ def create_medication_logs(medication):
                                        datetime.min.time().replace(hour=int(time_parts[0]), 
                                                                  minute=int(time_parts[1]))).isoformat()
             
-            add_medication_log(
+            logs.append(add_medication_log(
                 medication_id=medication_id,
                 scheduled_time=log_time,
-                taken=False
-            )
+                taken=False,
+                user_id=medication['user_id']
+            ))
             
         elif medication['frequency'] in ['twice_daily', 'three_times_daily', 'four_times_daily']:
             time_parts = medication['time'].split(':')
@@ -560,11 +844,12 @@ def create_medication_logs(medication):
                                        datetime.min.time().replace(hour=int(time_parts[0]), 
                                                                  minute=int(time_parts[1]))).isoformat()
             
-            add_medication_log(
+            logs.append(add_medication_log(
                 medication_id=medication_id,
                 scheduled_time=log_time,
-                taken=False
-            )
+                taken=False,
+                user_id=medication['user_id']
+            ))
             
         elif medication['frequency'] == 'weekly':
             days_since_start = (check_date - start_date).days
@@ -574,11 +859,14 @@ def create_medication_logs(medication):
                                            datetime.min.time().replace(hour=int(time_parts[0]), 
                                                                      minute=int(time_parts[1]))).isoformat()
                 
-                add_medication_log(
+                logs.append(add_medication_log(
                     medication_id=medication_id,
                     scheduled_time=log_time,
-                    taken=False
-                )
+                    taken=False,
+                    user_id=medication['user_id']
+                ))
+    
+    return logs
 
 def get_daily_tip():
     return random.choice(HEALTH_TIPS)
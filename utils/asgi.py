@@ -0,0 +1,249 @@
+"""ASGI entry point for serving Serenity with an async server.
+
+    uvicorn utils.asgi:app --host 0.0.0.0 --port 5000
+
+``/api/chat`` and ``/api/check_pending_response`` are handled natively on the
+event loop, so a chat waiting on Gemini holds a coroutine rather than a thread.
+Every other route, including the JSON APIs, runs the Flask app from
+``utils/app.py`` on a bounded thread pool (``ASGI_IO_WORKERS``), which keeps
+blocking file I/O off the loop. The existing WSGI deployment
+(``gunicorn utils.app:app``) is unchanged.
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import session
+
+from utils import app as serenity
+
+flask_app = serenity.app
+
+STREAM_BUFFER_CHUNKS = 8
+
+io_executor = ThreadPoolExecutor(max_workers=int(os.getenv('ASGI_IO_WORKERS', '32')),
+                                 thread_name_prefix='asgi-io')
+
+
+def build_environ(scope, body):
+    """Translate an ASGI HTTP scope and its body into a WSGI environ"""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': _BodyStream(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'CONTENT_LENGTH':
+            environ['CONTENT_LENGTH'] = value
+        else:
+            key = f"HTTP_{name}"
+            separator = '; ' if name == 'COOKIE' else ','
+            environ[key] = f"{environ[key]}{separator}{value}" if key in environ else value
+    environ.setdefault('CONTENT_LENGTH', str(len(body)))
+    return environ
+
+
+class _BodyStream:
+    """Minimal wsgi.input over an already received request body"""
+
+    def __init__(self, body):
+        self._body = body
+        self._pos = 0
+
+    def read(self, size=-1):
+        end = len(self._body) if size is None or size < 0 else self._pos + size
+        chunk = self._body[self._pos:end]
+        self._pos += len(chunk)
+        return chunk
+
+    def readline(self, size=-1):
+        newline = self._body.find(b'\n', self._pos)
+        end = len(self._body) if newline < 0 else newline + 1
+        if size is not None and size >= 0:
+            end = min(end, self._pos + size)
+        chunk = self._body[self._pos:end]
+        self._pos += len(chunk)
+        return chunk
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+def _encode_headers(headers):
+    return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+
+async def run_in_io(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(io_executor, fn, *args)
+
+
+async def call_flask(scope, body, send):
+    """Run a request through the Flask WSGI app on the I/O pool, streaming the body back.
+
+    The whole WSGI call, iteration and ``close()`` run on one pool thread, since
+    Flask's ``stream_with_context`` generators (e.g. /api/export) keep their
+    request context in that thread's context variables. Chunks reach the event
+    loop through a queue. The thread waits for a credit before each chunk, so at
+    most ``STREAM_BUFFER_CHUNKS`` are held for a slow client.
+    """
+    loop = asyncio.get_running_loop()
+    messages = asyncio.Queue()
+    credits = threading.Semaphore(STREAM_BUFFER_CHUNKS)
+    stop = threading.Event()
+
+    def deliver(kind, value=None):
+        loop.call_soon_threadsafe(messages.put_nowait, (kind, value))
+
+    def start_response(status, headers, exc_info=None):
+        deliver('start', (int(status.split(' ', 1)[0]), headers))
+        return lambda data: None
+
+    def produce():
+        try:
+            result = flask_app(build_environ(scope, body), start_response)
+            try:
+                for chunk in result:
+                    if not chunk:
+                        continue
+                    credits.acquire()
+                    if stop.is_set():
+                        break
+                    deliver('body', chunk)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+            deliver('end')
+        except BaseException as e:
+            deliver('error', e)
+
+    loop.run_in_executor(io_executor, produce)
+    try:
+        kind, value = await messages.get()
+        if kind == 'error':
+            raise value
+        status, headers = value
+        await send({'type': 'http.response.start', 'status': status, 'headers': _encode_headers(headers)})
+        while True:
+            kind, value = await messages.get()
+            if kind == 'end':
+                break
+            if kind == 'error':
+                raise value
+            await send({'type': 'http.response.body', 'body': value, 'more_body': True})
+            credits.release()
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    finally:
+        # The client may have gone away mid-stream; let the producer stop and close
+        stop.set()
+        credits.release()
+
+
+async def send_json(send, payload, headers=()):
+    body = json.dumps(payload).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': _encode_headers([('Content-Type', 'application/json'),
+                                            ('Content-Length', str(len(body)))] + list(headers))})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def _with_flask_request(environ, view):
+    """Run ``view`` inside a Flask request context and return its result plus the
+    response headers (session cookie etc.) Flask would have added"""
+    with flask_app.request_context(environ):
+        result = view()
+        response = flask_app.process_response(flask_app.response_class())
+        headers = [(k, v) for k, v in response.headers.items() if k.lower() not in ('content-type', 'content-length')]
+        return result, headers
+
+
+async def chat(scope, receive, send):
+    body = await read_body(receive)
+    environ = build_environ(scope, body)
+
+    def prepare():
+        session_id, user_message = serenity.read_chat_request()
+        reply = serenity.local_chat_reply(session_id, user_message)
+        prompt = None if reply else serenity.build_chat_prompt(session_id, user_message)
+        return session_id, user_message, reply, prompt
+
+    # Session, user lookup and local answers touch the filesystem, so they run on the pool
+    (session_id, user_message, reply, prompt), headers = await run_in_io(_with_flask_request, environ, prepare)
+    if reply is None:
+        print("No quick/emergency/health matches, proceeding to Gemini API")
+        reply = await serenity.gemini_chat_reply_async(session_id, user_message, prompt)
+    await send_json(send, reply, headers)
+
+
+async def check_pending_response(scope, receive, send):
+    body = await read_body(receive)
+    environ = build_environ(scope, body)
+    session_id, headers = await run_in_io(_with_flask_request, environ, lambda: session.get('_id'))
+    await send_json(send, serenity.pending_response_payload(session_id), headers)
+
+
+ASYNC_ROUTES = {
+    ('POST', '/api/chat'): chat,
+    ('GET', '/api/check_pending_response'): check_pending_response,
+}
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            io_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        raise RuntimeError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    handler = ASYNC_ROUTES.get((scope['method'], scope['path']))
+    if handler is not None:
+        await handler(scope, receive, send)
+    else:
+        await call_flask(scope, await read_body(receive), send)
@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token for English text)"""
+    return max(1, len(text or '') // 4)
+
+
+def _clip(text, max_tokens):
+    """Trim text to roughly ``max_tokens`` tokens, keeping the start"""
+    limit = max_tokens * 4
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(' ', 1)[0] + '...'
+
+
+class _Conversation:
+    __slots__ = ('turns', 'tokens', 'summary', 'last_seen')
+
+    def __init__(self):
+        self.turns = deque()  # (role, text, tokens), oldest first
+        self.tokens = 0
+        self.summary = ''
+        self.last_seen = time.monotonic()
+
+
+class ChatMemory:
+    """Bounded per-session conversation history for the chat assistant.
+
+    Each session keeps at most ``max_turns`` exchanges and ``max_tokens``
+    approximate tokens of history. Turns pushed out of the window are folded
+    into a short running summary of what the user asked earlier, itself capped
+    at ``summary_tokens``, so the prompt stays the same size however long the
+    conversation runs. Sessions are kept in LRU order; the least recently used
+    is dropped beyond ``max_sessions`` and any session idle for more than
+    ``idle_timeout`` seconds is forgotten.
+
+    History lives in this process only. With several gunicorn workers, a
+    follow-up question served by a different worker starts without context.
+    """
+
+    def __init__(self, max_sessions=1000, max_turns=6, max_tokens=600, summary_tokens=80,
+                 reply_tokens=150, idle_timeout=1800):
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        self.reply_tokens = reply_tokens
+        self.idle_timeout = idle_timeout
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._evicted = 0
+        self._summarized_turns = 0
+
+    def _evict(self, now):
+        while self._sessions:
+            session_id, convo = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - convo.last_seen < self.idle_timeout:
+                break
+            del self._sessions[session_id]
+            self._evicted += 1
+
+    def _compact(self, convo):
+        dropped = []
+        # Turns are stored in user/assistant pairs, so whole exchanges are dropped together
+        while convo.turns and (len(convo.turns) > self.max_turns * 2 or convo.tokens > self.max_tokens):
+            for _ in range(min(2, len(convo.turns))):
+                role, text, tokens = convo.turns.popleft()
+                convo.tokens -= tokens
+                if role == 'user':
+                    dropped.append(text)
+        if dropped:
+            self._summarized_turns += len(dropped)
+            summary = '; '.join(([convo.summary] if convo.summary else []) + dropped)
+            # Keep the most recent topics when the summary itself is over budget
+            limit = self.summary_tokens * 4
+            if len(summary) > limit:
+                summary = '...' + summary[-limit:].split(' ', 1)[-1]
+            convo.summary = summary
+
+    def add_exchange(self, session_id, user_text, assistant_text):
+        """Record one user question and the assistant's reply"""
+        now = time.monotonic()
+        user_text = _clip(user_text, self.reply_tokens)
+        assistant_text = _clip(assistant_text, self.reply_tokens)
+        with self._lock:
+            convo = self._sessions.get(session_id)
+            if convo is None:
+                convo = self._sessions[session_id] = _Conversation()
+            else:
+                self._sessions.move_to_end(session_id)
+            for role, text in (('user', user_text), ('assistant', assistant_text)):
+                tokens = estimate_tokens(text)
+                convo.turns.append((role, text, tokens))
+                convo.tokens += tokens
+            convo.last_seen = now
+            self._compact(convo)
+            self._evict(now)
+
+    def get(self, session_id):
+        """Return ``(summary, [(role, text), ...])`` for a session"""
+        now = time.monotonic()
+        with self._lock:
+            convo = self._sessions.get(session_id)
+            if convo is None:
+                return '', []
+            if now - convo.last_seen >= self.idle_timeout:
+                del self._sessions[session_id]
+                self._evicted += 1
+                return '', []
+            self._sessions.move_to_end(session_id)
+            convo.last_seen = now
+            return convo.summary, [(role, text) for role, text, _ in convo.turns]
+
+    def clear(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def format_history(self, session_id):
+        """History as prompt text, empty when the session has no context yet"""
+        summary, turns = self.get(session_id)
+        lines = []
+        if summary:
+            lines.append(f"Earlier the user asked about: {summary}")
+        for role, text in turns:
+            lines.append(f"{'User' if role == 'user' else 'Assistant'}: {text}")
+        return '\n'.join(lines)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'evicted_sessions': self._evicted,
+                'summarized_turns': self._summarized_turns,
+                'max_turns': self.max_turns,
+                'max_tokens': self.max_tokens,
+            }
@@ -0,0 +1,122 @@
+"""Convert storage collections between file formats, or split them into per-user shards.
+
+    python -m utils.convert_storage --to msgpack --collections medication_logs health_logs
+    STORAGE_FORMATS=medication_logs=msgpack,health_logs=msgpack gunicorn utils.app:app
+
+    python -m utils.convert_storage --layout sharded
+    STORAGE_LAYOUT=sharded gunicorn utils.app:app
+
+Each collection is read from whichever file exists (``<name>.json`` or
+``<name>.msgpack``) and streamed into the target format one record at a time,
+so memory stays flat on large files and the target is written in a single pass.
+The app only reads the format and layout it is configured for, so set
+``STORAGE_FORMAT``/``STORAGE_FORMATS``/``STORAGE_LAYOUT`` to match afterwards. Stop the app first: a write during conversion would be lost.
+
+``--layout sharded`` writes ``users/<user id>/<collection>`` files plus the
+``email_index`` file and leaves the global files in place.
+"""
+import argparse
+import os
+import sys
+from collections import defaultdict
+
+from utils.serializers import CODECS, get_codec
+
+# Not imported from utils.storage: importing it creates missing files in the configured format
+DEFAULT_DATA_DIR = os.getenv('SERENITY_DATA_DIR') or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'storage', 'data')
+COLLECTIONS = ['users', 'medications', 'medication_logs', 'health_logs', 'emergency_contacts']
+
+
+def find_source(data_dir, collection):
+    """Return (path, codec) for the collection's existing file, or (None, None)"""
+    for name in ('json', 'msgpack'):
+        codec = get_codec(name)
+        path = os.path.join(data_dir, collection + codec.extension)
+        if os.path.exists(path):
+            return path, codec
+    return None, None
+
+
+def convert_file(source_path, source_codec, target_path, target_codec):
+    """Stream records from one file into another format; returns the record count"""
+    return target_codec.write_stream(target_path, source_codec.iter(source_path))
+
+
+def shard_collections(data_dir, collections, target_codec=None):
+    """Split global collection files into per-user shard files under ``users/``"""
+    users_dir = os.path.join(data_dir, 'users')
+    medication_owners = {}
+    # COLLECTIONS order puts medications before their logs, whose owner is looked up through them
+    for collection in COLLECTIONS:
+        if collection not in collections and not (collection == 'medications' and 'medication_logs' in collections):
+            continue
+        source_path, source_codec = find_source(data_dir, collection)
+        if source_path is None:
+            print(f"{collection}: no file in {data_dir}, skipped")
+            continue
+        by_user = defaultdict(list)
+        orphans = 0
+        for record in source_codec.iter(source_path):
+            if collection == 'users':
+                user_id = record['id']
+            else:
+                user_id = record.get('user_id') or medication_owners.get(record.get('medication_id'))
+            if collection == 'medications':
+                medication_owners[record['id']] = user_id
+            if user_id:
+                by_user[user_id].append(record)
+            else:
+                orphans += 1
+        if collection not in collections:
+            continue
+
+        codec = target_codec or source_codec
+        for user_id, records in by_user.items():
+            shard_dir = os.path.join(users_dir, user_id)
+            os.makedirs(shard_dir, exist_ok=True)
+            codec.write(os.path.join(shard_dir, collection + codec.extension), records)
+        if collection == 'users':
+            index = [{'email': user['email'], 'id': user_id} for user_id, (user,) in by_user.items()]
+            codec.write(os.path.join(data_dir, 'email_index' + codec.extension), index)
+        note = f", {orphans} without an owner left out" if orphans else ''
+        print(f"{collection}: {sum(map(len, by_user.values()))} records in {len(by_user)} shards{note}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--to', choices=sorted(CODECS), help='target format')
+    parser.add_argument('--layout', choices=['sharded'], help='split global files into per-user shards')
+    parser.add_argument('--collections', nargs='+', choices=COLLECTIONS, default=COLLECTIONS)
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--remove-source', action='store_true',
+                        help='delete the old file when the format changes its extension')
+    args = parser.parse_args(argv)
+    if not args.to and not args.layout:
+        parser.error('nothing to do: pass --to and/or --layout')
+
+    target_codec = get_codec(args.to) if args.to else None
+    if args.layout == 'sharded':
+        shard_collections(args.data_dir, args.collections, target_codec)
+        print("Set STORAGE_LAYOUT=sharded so the app reads the shards")
+        return
+
+    for collection in args.collections:
+        source_path, source_codec = find_source(args.data_dir, collection)
+        if source_path is None:
+            print(f"{collection}: no file in {args.data_dir}, skipped")
+            continue
+        target_path = os.path.join(args.data_dir, collection + target_codec.extension)
+        before = os.path.getsize(source_path)
+        count = convert_file(source_path, source_codec, target_path, target_codec)
+        after = os.path.getsize(target_path)
+        if args.remove_source and source_path != target_path:
+            os.remove(source_path)
+        print(f"{collection}: {count} records, {before / 1e6:.2f} MB -> {after / 1e6:.2f} MB "
+              f"({os.path.basename(source_path)} -> {os.path.basename(target_path)})")
+
+    print(f"Set STORAGE_FORMATS (or STORAGE_FORMAT={args.to}) so the app reads the converted files")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,219 @@
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from utils.ids import new_id
+from utils.records import EmergencyContact
+from utils.storage import DATA_DIR, data_file, data_files, file_version, iter_records
+
+EMERGENCY_OUTBOX_FILE = os.path.join(DATA_DIR, 'emergency_outbox.jsonl')
+
+
+class FileChannel:
+    """Writes each notification as a JSON line; stands in for SMS/SMTP in tests and local runs"""
+
+    name = 'file'
+
+    def __init__(self, path=EMERGENCY_OUTBOX_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, alert, contact):
+        line = json.dumps({
+            'alert_id': alert['id'],
+            'user_id': alert['user_id'],
+            'contact_id': contact['id'],
+            'to': contact.get('phone') or contact.get('email'),
+            'message': alert['message'],
+            'sent_at': datetime.now().isoformat(),
+        })
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+
+
+class DesktopChannel:
+    """Local desktop notification through plyer"""
+
+    name = 'desktop'
+
+    def send(self, alert, contact):
+        from plyer import notification
+        notification.notify(
+            title=f"Emergency alert for {contact['name']}",
+            message=alert['message'][:256],
+            app_name='Serenity',
+            timeout=30,
+        )
+
+
+CHANNELS = {
+    'file': FileChannel,
+    'desktop': DesktopChannel,
+}
+
+
+class PrimaryContactIndex:
+    """user_id -> primary emergency contact, cached per contacts file.
+
+    Each file's primary contacts are kept with the file's version and re-read
+    when it changes, so a contact added, changed or deleted through another
+    worker process is seen on the next lookup. A lookup whose file has not
+    changed costs one ``os.stat``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._files = {}  # file path -> (version, {user_id: EmergencyContact})
+
+    def load(self):
+        for file_path in data_files('emergency_contacts'):
+            self._primaries(file_path)
+
+    def get(self, user_id):
+        return self._primaries(data_file('emergency_contacts', user_id)).get(user_id)
+
+    def _primaries(self, file_path):
+        version = file_version(file_path)
+        with self._lock:
+            cached = self._files.get(file_path)
+        if cached and cached[0] == version:
+            return cached[1]
+        primary = {}
+        for contact in iter_records(file_path):
+            if contact.get('is_primary'):
+                primary[contact['user_id']] = EmergencyContact.from_dict(contact)
+        with self._lock:
+            self._files[file_path] = (version, primary)
+        return primary
+
+
+class EmergencyDispatcher:
+    """Fan emergency alerts out to a user's primary contact over every channel.
+
+    ``dispatch`` only builds the alert and puts it on an in-memory outbox queue,
+    so the chat request answers immediately. Worker threads take alerts off the
+    queue and fan them out to all channels in parallel, retrying each failed
+    delivery with a short exponential backoff. Every attempt is kept as a
+    delivery record, and the time from dispatch to first successful delivery
+    is measured against ``sla_seconds``.
+    """
+
+    def __init__(self, channels, workers=2, max_attempts=3, retry_backoff=0.2, sla_seconds=2.0,
+                 history_size=500):
+        self.channels = channels
+        self.index = PrimaryContactIndex()
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.sla_seconds = sla_seconds
+        self.deliveries = deque(maxlen=history_size)
+        self._outbox = queue.Queue()
+        self._sender = ThreadPoolExecutor(max_workers=max(len(channels), 1) * workers * 4,
+                                          thread_name_prefix='emergency-send')
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=history_size)
+        self._counters = {'dispatched': 0, 'delivered': 0, 'failed': 0, 'no_contact': 0, 'sla_breaches': 0}
+        self._workers = [threading.Thread(target=self._run, name=f'emergency-dispatch-{i}', daemon=True)
+                         for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def dispatch(self, user_id, message):
+        """Queue an alert for the user's primary contact; returns the alert or None"""
+        contact = self.index.get(user_id)
+        if contact is None:
+            self._count('no_contact')
+            return None
+        alert = {
+            'id': new_id(),
+            'user_id': user_id,
+            'contact_id': contact['id'],
+            'contact_name': contact['name'],
+            'message': message,
+            'created_at': datetime.now().isoformat(),
+            'enqueued': time.monotonic(),
+        }
+        self._count('dispatched')
+        self._outbox.put((alert, contact))
+        return alert
+
+    def _deliver(self, channel, alert, contact):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                channel.send(alert, contact)
+                status, error = 'delivered', None
+            except Exception as e:
+                status, error = 'failed', str(e)
+            self.deliveries.append({
+                'alert_id': alert['id'],
+                'channel': channel.name,
+                'contact_id': contact['id'],
+                'attempt': attempt,
+                'status': status,
+                'error': error,
+                'at': datetime.now().isoformat(),
+            })
+            if status == 'delivered':
+                return time.monotonic()
+            time.sleep(self.retry_backoff * (2 ** (attempt - 1)))
+        return None
+
+    def _run(self):
+        while True:
+            alert, contact = self._outbox.get()
+            # Hand each channel its own sender thread so a slow or retrying channel
+            # delays neither the other channels nor the next alert in the outbox
+            pending = {'remaining': len(self.channels), 'delivered_at': None}
+            for channel in self.channels:
+                future = self._sender.submit(self._deliver, channel, alert, contact)
+                future.add_done_callback(lambda f, a=alert, p=pending: self._channel_done(a, p, f.result()))
+            if not self.channels:
+                self._count('failed')
+            self._outbox.task_done()
+
+    def _channel_done(self, alert, pending, delivered_at):
+        with self._lock:
+            pending['remaining'] -= 1
+            first = delivered_at is not None and pending['delivered_at'] is None
+            if first:
+                pending['delivered_at'] = delivered_at
+                latency = delivered_at - alert['enqueued']
+                self._counters['delivered'] += 1
+                self._latencies.append(latency)
+                if latency > self.sla_seconds:
+                    self._counters['sla_breaches'] += 1
+            failed = pending['remaining'] == 0 and pending['delivered_at'] is None
+            if failed:
+                self._counters['failed'] += 1
+        if first and latency > self.sla_seconds:
+            print(f"Emergency alert {alert['id']} missed its SLA: {latency:.3f}s")
+        if failed:
+            print(f"Emergency alert {alert['id']} could not be delivered on any channel")
+
+    def metrics(self):
+        with self._lock:
+            data = dict(self._counters)
+            latencies = sorted(self._latencies)
+        data['queued'] = self._outbox.qsize()
+        data['sla_seconds'] = self.sla_seconds
+        if latencies:
+            data['latency_p50_ms'] = latencies[len(latencies) // 2] * 1000
+            data['latency_max_ms'] = latencies[-1] * 1000
+        return data
+
+
+def create_dispatcher(channel_names, **kwargs):
+    """Build a dispatcher from channel names such as ``['file', 'desktop']``"""
+    channels = [CHANNELS[name]() for name in channel_names if name in CHANNELS]
+    dispatcher = EmergencyDispatcher(channels, **kwargs)
+    dispatcher.index.load()
+    return dispatcher
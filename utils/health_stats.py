@@ -0,0 +1,273 @@
+import math
+import threading
+import time
+from collections import deque
+from operator import itemgetter
+
+from utils.ids import order_key
+from utils.records import HealthLog
+from utils.storage import data_files, file_version, iter_records
+
+MOOD_SCORES = {'terrible': 0, 'bad': 1, 'okay': 2, 'good': 3, 'great': 4}
+BREATHING_SCORES = {'none': 0, 'mild': 1, 'moderate': 2, 'severe': 3}
+
+
+def _number(low, high):
+    def parse(value):
+        if value is None or value == '':
+            return None
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return None
+        return number if low <= number <= high else None
+    return parse
+
+
+def _score(scores):
+    return lambda value: scores.get(value) if isinstance(value, str) else None
+
+
+# field -> (label, parser, direction that is worrying, smallest std used for z-scores)
+# The std floor keeps a user whose readings never vary from being flagged for
+# the first small change.
+METRICS = {
+    'heart_rate': ('Heart rate', _number(20, 250), 'both', 4.0),
+    'pain_level': ('Pain level', _number(0, 10), 'high', 1.0),
+    'breathing_difficulty': ('Breathing difficulty', _score(BREATHING_SCORES), 'high', 0.5),
+    'mood': ('Mood', _score(MOOD_SCORES), 'low', 0.5),
+}
+
+# What a replayed log needs: its metrics plus what alerts and ordering refer to
+_REPLAY_FIELDS = frozenset(('id', 'user_id', 'timestamp', *METRICS))
+
+
+class RunningStat:
+    """Welford mean/variance over all readings plus an exponentially weighted mean/variance of recent ones"""
+
+    __slots__ = ('count', 'mean', 'm2', 'ewm_mean', 'ewm_var', 'last')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.ewm_mean = 0.0
+        self.ewm_var = 0.0
+        self.last = None
+
+    def update(self, x, alpha):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+        if self.count == 1:
+            self.ewm_mean = x
+        else:
+            diff = x - self.ewm_mean
+            increment = alpha * diff
+            self.ewm_mean += increment
+            self.ewm_var = (1 - alpha) * (self.ewm_var + diff * increment)
+        self.last = x
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': round(self.mean, 2),
+            'std': round(self.std, 2),
+            'recent_mean': round(self.ewm_mean, 2),
+            'recent_std': round(math.sqrt(self.ewm_var), 2),
+            'last': self.last,
+        }
+
+
+class HealthStats:
+    """Per-user running statistics of health check readings, with anomaly flags.
+
+    Each stored health log is folded into its user's statistics in O(1), and
+    readings that deviate from that user's recent baseline raise an alert: more
+    than ``z_threshold`` exponentially weighted standard deviations from the
+    exponentially weighted mean, in the metric's worrying direction. Nothing is
+    flagged until a metric has ``min_samples`` readings.
+
+    The health logs files are the source of truth, so every worker process sees
+    every log whichever worker stored it. ``refresh`` checks the file version
+    of the user's logs (one ``os.stat`` when nothing changed) and, when it
+    changed, reads the file once and observes only the records appended since
+    the last read, as ``PrimaryContactIndex`` does for contacts. Health logs
+    are only ever appended, so the records already read are a prefix. In the
+    global layout every change means a pass over the whole file, as each write
+    already makes; the sharded layout reads just that user's file.
+
+    Each user's logs are observed in creation order (id order, see
+    utils.ids). Logs older than the newest one already observed, such as an
+    import's back-dated ones, make that user's statistics be replayed from all
+    their logs. Logs are held for that sort as slotted ``HealthLog`` records
+    carrying only the fields the statistics use.
+    """
+
+    def __init__(self, alpha=0.1, z_threshold=3.0, min_samples=5, alerts_per_user=10):
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.min_samples = min_samples
+        self.alerts_per_user = alerts_per_user
+        self._lock = threading.Lock()
+        self._stats = {}     # user_id -> {field: RunningStat}
+        self._alerts = {}    # user_id -> deque of recent alerts, newest last
+        self._counts = {}    # user_id -> [logs observed, anomalies], so one user can be rebuilt
+        self._newest = {}    # user_id -> order key of the newest log observed
+        self._files = {}     # file path -> (version, records read)
+        self._observed = 0
+        self._anomalies = 0
+        self._file_reads = 0
+        self._rebuild_seconds = None
+
+    def observe(self, log):
+        """Catch up with a log already written to storage; returns the alerts it raised"""
+        self.refresh(log['user_id'])
+        with self._lock:
+            return [alert for alert in self._alerts.get(log['user_id'], ()) if alert['log_id'] == log['id']]
+
+    def refresh(self, user_id=None):
+        """Observe logs written since the last read, by any process; every file when ``user_id`` is None"""
+        with self._lock:
+            for file_path in data_files('health_logs', user_id):
+                version = file_version(file_path)
+                known = self._files.get(file_path)
+                if known is None or known[0] != version:
+                    self._read_file(file_path, version)
+
+    def _read_file(self, file_path, version, replay=frozenset()):
+        """Observe the records past those already read, and all records of the ``replay`` users, in order"""
+        _, done = self._files.get(file_path, (None, 0))
+        new = {}  # user_id -> [(order key, HealthLog)]
+        read = 0
+        for log in iter_records(file_path):
+            read += 1
+            user_id = log.get('user_id')
+            if user_id and (read > done or user_id in replay):
+                new.setdefault(user_id, []).append((order_key(log), HealthLog.from_dict(log, _REPLAY_FIELDS)))
+        self._file_reads += 1
+        if read < done:
+            # Rewritten rather than appended to, e.g. converted: start over from every file
+            self._rebuild()
+            return
+
+        late = set()
+        for user_id, entries in new.items():
+            entries.sort(key=itemgetter(0))
+            if user_id in replay:
+                self._forget(user_id)
+            elif user_id in self._newest and entries[0][0] < self._newest[user_id]:
+                late.add(user_id)
+                continue
+            for _, log in entries:
+                self._observe(log)
+            self._newest[user_id] = entries[-1][0]
+        self._files[file_path] = (version, read)
+        if late:
+            self._read_file(file_path, version, late)
+
+    def _forget(self, user_id):
+        self._stats.pop(user_id, None)
+        self._alerts.pop(user_id, None)
+        self._newest.pop(user_id, None)
+        observed, anomalies = self._counts.pop(user_id, (0, 0))
+        self._observed -= observed
+        self._anomalies -= anomalies
+
+    def _observe(self, log):
+        counts = self._counts.setdefault(log['user_id'], [0, 0])
+        counts[0] += 1
+        self._observed += 1
+        user_stats = self._stats.setdefault(log['user_id'], {})
+        alerts = []
+        for field, (label, parse, direction, min_std) in METRICS.items():
+            x = parse(log.get(field))
+            if x is None:
+                continue
+            stat = user_stats.get(field)
+            if stat is None:
+                stat = user_stats[field] = RunningStat()
+            elif stat.count >= self.min_samples:
+                z = (x - stat.ewm_mean) / max(math.sqrt(stat.ewm_var), min_std)
+                if (z >= self.z_threshold and direction != 'low') or (z <= -self.z_threshold and direction != 'high'):
+                    alerts.append(self._alert(log, field, label, x, stat.ewm_mean, z))
+            stat.update(x, self.alpha)
+
+        if alerts:
+            counts[1] += len(alerts)
+            self._anomalies += len(alerts)
+            self._alerts.setdefault(log['user_id'], deque(maxlen=self.alerts_per_user)).extend(alerts)
+        return alerts
+
+    @staticmethod
+    def _alert(log, field, label, value, expected, z):
+        if field == 'heart_rate':
+            shown, usual = f"{value:.0f} bpm", f"{expected:.0f} bpm"
+        else:
+            shown, usual = f"{value:g}", f"{expected:.1f}"
+        if field == 'mood':
+            message = f"{label} is much lower than usual"
+        elif field == 'breathing_difficulty':
+            message = f"{label} is much worse than usual"
+        else:
+            message = f"{label} of {shown} is well {'above' if z > 0 else 'below'} your usual {usual}"
+        return {
+            'metric': field,
+            'value': value,
+            'expected': round(expected, 2),
+            'z_score': round(z, 1),
+            'message': message,
+            'log_id': log.get('id'),
+            'timestamp': log.get('timestamp'),
+        }
+
+    def rebuild(self):
+        """Recompute every user's statistics from stored health logs"""
+        start = time.perf_counter()
+        with self._lock:
+            self._rebuild()
+            self._rebuild_seconds = time.perf_counter() - start
+        return self._observed
+
+    def _rebuild(self):
+        self._stats, self._alerts, self._counts, self._newest, self._files = {}, {}, {}, {}, {}
+        self._observed = self._anomalies = 0
+        for file_path in data_files('health_logs'):
+            self._read_file(file_path, file_version(file_path))
+
+    def rebuild_user(self, user_id):
+        """Recompute one user's statistics, e.g. after importing logs"""
+        with self._lock:
+            for file_path in data_files('health_logs', user_id):
+                self._read_file(file_path, file_version(file_path), frozenset((user_id,)))
+
+    def summary(self, user_id):
+        self.refresh(user_id)
+        with self._lock:
+            user_stats = self._stats.get(user_id, {})
+            return {field: stat.summary() for field, stat in user_stats.items()}
+
+    def alerts(self, user_id, since=None):
+        """The user's recent alerts, newest first; ``since`` is an ISO timestamp"""
+        self.refresh(user_id)
+        with self._lock:
+            alerts = list(self._alerts.get(user_id, ()))
+        if since is not None:
+            alerts = [alert for alert in alerts if (alert['timestamp'] or '') >= since]
+        return alerts[::-1]
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'users': len(self._stats),
+                'observed': self._observed,
+                'anomalies': self._anomalies,
+                'file_reads': self._file_reads,
+                'rebuild_seconds': round(self._rebuild_seconds, 3) if self._rebuild_seconds is not None else None,
+            }
@@ -0,0 +1,168 @@
+import json
+import math
+import os
+import re
+from array import array
+
+KNOWLEDGE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              'storage', 'knowledge', 'health_faq.json')
+
+STOPWORDS = frozenset("""
+a about am an and any are as at be been but by can could do does did for from had has have how i if in
+into is it its me my of on or our should so than that the their them there these they this to too was
+we were what when where which who why will with would you your get got some much many more most
+""".split())
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def _stem(token):
+    """Very light suffix stripping so 'headaches' matches 'headache' and 'taking' matches 'take'.
+
+    A final 'e' is dropped from every word, so 'take', 'takes', 'taking' and
+    'taked' all become 'tak', and a doubled consonant left by -ing/-ed is
+    undoubled, so 'stopping' matches 'stop'.
+    """
+    if len(token) > 5 and token.endswith('ing'):
+        token = _undouble(token[:-3])
+    elif len(token) > 4 and token.endswith('ed'):
+        token = _undouble(token[:-2])
+    elif len(token) > 4 and token.endswith('ies'):
+        token = token[:-3] + 'y'
+    elif len(token) > 4 and token.endswith(('ches', 'shes', 'sses', 'xes')):
+        token = token[:-2]
+    elif len(token) > 3 and token.endswith('s') and not token.endswith(('ss', 'us', 'is')):
+        token = token[:-1]
+    if len(token) > 3 and token.endswith('e') and not token.endswith('ee'):
+        token = token[:-1]
+    return token
+
+
+def _undouble(token):
+    if len(token) > 2 and token[-1] == token[-2] and token[-1] not in 'aeiouylsz':
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    return [_stem(t) for t in _TOKEN.findall((text or '').lower()) if t not in STOPWORDS]
+
+
+class KnowledgeBase:
+    """BM25 index over the on-disk health FAQ.
+
+    Everything query-independent is computed once at build time: each term maps
+    to an id, and the id's postings are two parallel typed arrays holding the
+    matching document ids and their precomputed BM25 weights. Answering a query
+    is then a few dictionary lookups and additions.
+
+    ``search`` returns the best entry with a ``confidence`` in [0, 1]: the share
+    of the query's IDF mass that the entry covers, so questions with several
+    unrelated words don't get answered on the strength of one common term.
+    ``best_answer`` can also require a minimum number of matched query terms.
+    """
+
+    QUESTION_BOOST = 2  # question and keywords count twice as much as answer text
+
+    def __init__(self, entries, k1=1.2, b=0.75):
+        self.entries = entries
+        self.k1 = k1
+        self.b = b
+        self._term_ids = {}
+        self._doc_ids = []      # term id -> array of document indexes
+        self._weights = []      # term id -> array of BM25 weights, parallel to _doc_ids
+        self._idf = array('f')  # term id -> idf
+        self._build()
+
+    @classmethod
+    def from_file(cls, path=KNOWLEDGE_FILE, **kwargs):
+        if not os.path.exists(path):
+            print(f"Knowledge base file not found: {path}")
+            return cls([], **kwargs)
+        with open(path, 'r') as f:
+            return cls(json.load(f), **kwargs)
+
+    def _document_tokens(self, entry):
+        heading = ' '.join([entry.get('question', '')] + entry.get('keywords', []))
+        return tokenize(heading) * self.QUESTION_BOOST + tokenize(entry.get('answer', ''))
+
+    def _build(self):
+        term_freqs = []
+        lengths = array('I')
+        for entry in self.entries:
+            freqs = {}
+            tokens = self._document_tokens(entry)
+            for token in tokens:
+                freqs[token] = freqs.get(token, 0) + 1
+            term_freqs.append(freqs)
+            lengths.append(len(tokens))
+
+        n_docs = len(self.entries)
+        avg_len = (sum(lengths) / n_docs) if n_docs else 0.0
+
+        postings = {}
+        for doc, freqs in enumerate(term_freqs):
+            for token, tf in freqs.items():
+                postings.setdefault(token, []).append((doc, tf))
+
+        for token, docs in postings.items():
+            df = len(docs)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            doc_ids = array('H' if n_docs < 65536 else 'I')
+            weights = array('f')
+            for doc, tf in docs:
+                norm = self.k1 * (1 - self.b + self.b * lengths[doc] / avg_len)
+                doc_ids.append(doc)
+                weights.append(idf * tf * (self.k1 + 1) / (tf + norm))
+            self._term_ids[token] = len(self._doc_ids)
+            self._doc_ids.append(doc_ids)
+            self._weights.append(weights)
+            self._idf.append(idf)
+
+        # Unknown query words are treated as maximally rare when computing confidence
+        self._max_idf = math.log(1 + (n_docs + 0.5) / 0.5) if n_docs else 0.0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def search(self, query, limit=1):
+        """Return up to ``limit`` matches as dicts with entry, score and confidence"""
+        terms = set(tokenize(query))
+        if not terms or not self.entries:
+            return []
+
+        scores = {}
+        covered = {}
+        matched = {}
+        query_idf = 0.0
+        for term in terms:
+            term_id = self._term_ids.get(term)
+            if term_id is None:
+                query_idf += self._max_idf
+                continue
+            idf = self._idf[term_id]
+            query_idf += idf
+            for doc, weight in zip(self._doc_ids[term_id], self._weights[term_id]):
+                scores[doc] = scores.get(doc, 0.0) + weight
+                covered[doc] = covered.get(doc, 0.0) + idf
+                matched[doc] = matched.get(doc, 0) + 1
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [{
+            'entry': self.entries[doc],
+            'score': score,
+            'confidence': covered[doc] / query_idf if query_idf else 0.0,
+            'matched_terms': matched[doc],
+            'query_terms': len(terms),
+        } for doc, score in ranked]
+
+    def best_answer(self, query, threshold, min_terms=1):
+        """Best match if its confidence clears ``threshold`` and it matches ``min_terms`` query terms
+        (or all of them, for shorter queries), otherwise None"""
+        matches = self.search(query, limit=1)
+        if not matches:
+            return None
+        match = matches[0]
+        if match['confidence'] >= threshold and match['matched_terms'] >= min(min_terms, match['query_terms']):
+            return match
+        return None
@@ -0,0 +1,104 @@
+"""Slotted record types for records held in memory.
+
+Storage files decode to plain dicts. Code that keeps many records around
+converts them with ``from_dict``: a slotted record has no per-instance
+``__dict__`` and no per-record key strings, and the low-cardinality string
+fields (user ids, moods, relationships) are interned so equal values share one
+string. ``HealthStats`` holds every health log this way while it replays them
+in order, and ``PrimaryContactIndex`` caches each user's primary contact.
+
+Records support ``record['field']`` and ``record.get('field')`` as well as
+attribute access, so templates and code written against the dicts keep working.
+``to_dict`` gives the storage/JSON form back.
+"""
+import sys
+from dataclasses import dataclass
+
+
+class _RecordMixin:
+    __slots__ = ()
+    _interned = ()
+
+    @classmethod
+    def from_dict(cls, data, fields=None):
+        """Record from a storage dict; with ``fields``, only those are kept and the rest left None"""
+        if fields is None:
+            values = [data.get(name) for name in cls.__slots__]
+        else:
+            values = [data.get(name) if name in fields else None for name in cls.__slots__]
+        for i in cls._intern_positions:
+            if values[i].__class__ is str:
+                values[i] = sys.intern(values[i])
+        return cls(*values)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name)
+
+    def __setitem__(self, name, value):
+        setattr(self, name, value)
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+
+    def keys(self):
+        return self.__slots__
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        slots = cls.__dict__.get('__slots__', ())
+        cls._intern_positions = tuple(i for i, name in enumerate(slots) if name in cls._interned)
+
+
+@dataclass(slots=True)
+class HealthLog(_RecordMixin):
+    _interned = ('user_id', 'mood', 'energy_level', 'sleep_quality', 'appetite', 'mobility',
+                 'breathing_difficulty', 'hydration_level', 'medication_taken', 'bowel_movement')
+
+    id: str = None
+    user_id: str = None
+    mood: str = None
+    pain_level: int = None
+    notes: str = None
+    timestamp: str = None
+    energy_level: str = None
+    sleep_quality: str = None
+    appetite: str = None
+    mobility: str = None
+    heart_rate: str = None
+    breathing_difficulty: str = None
+    hydration_level: str = None
+    medication_taken: str = None
+    bowel_movement: str = None
+
+
+@dataclass(slots=True)
+class EmergencyContact(_RecordMixin):
+    _interned = ('user_id', 'relationship')
+
+    id: str = None
+    user_id: str = None
+    name: str = None
+    relationship: str = None
+    phone: str = None
+    email: str = None
+    is_primary: bool = False
+    created_at: str = None
+
+
+RECORD_TYPES = {
+    'health_logs': HealthLog,
+    'emergency_contacts': EmergencyContact,
+}
+
+
+def typed(collection, records):
+    """Yield records of a collection as slotted record objects"""
+    from_dict = RECORD_TYPES[collection].from_dict
+    for record in records:
+        yield from_dict(record)
@@ -0,0 +1,295 @@
+"""Medication reminders, fired at each scheduled dose.
+
+Run them in exactly one process, since every process running the service fires
+every reminder: either one web process with ``REMINDERS_ENABLED=1``, or a
+dedicated process beside the web workers::
+
+    python -m utils.reminders --notifiers stub,desktop
+"""
+import argparse
+import heapq
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from utils.storage import SHARDED, data_file, file_version, iter_records, shard_ids
+
+
+class StubNotifier:
+    """Keeps the last ``history_size`` fired reminders in memory and prints them; used by default and in tests"""
+
+    name = 'stub'
+
+    def __init__(self, history_size=500):
+        self.sent = deque(maxlen=history_size)
+
+    def notify(self, reminder):
+        self.sent.append(reminder)
+        print(f"Reminder: {reminder['message']}")
+
+
+class DesktopNotifier:
+    """Desktop notification through plyer"""
+
+    name = 'desktop'
+
+    def notify(self, reminder):
+        from plyer import notification
+        notification.notify(title='Medication reminder', message=reminder['message'],
+                            app_name='Serenity', timeout=60)
+
+
+class SpeechNotifier:
+    """Reads the reminder aloud through pyttsx3"""
+
+    name = 'speech'
+
+    def __init__(self):
+        # pyttsx3 engines are not thread-safe, so speak one reminder at a time
+        self._lock = threading.Lock()
+
+    def notify(self, reminder):
+        import pyttsx3
+        with self._lock:
+            engine = pyttsx3.init()
+            engine.say(reminder['message'])
+            engine.runAndWait()
+
+
+NOTIFIERS = {
+    'stub': StubNotifier,
+    'desktop': DesktopNotifier,
+    'speech': SpeechNotifier,
+}
+
+
+def _timestamp(value):
+    return datetime.fromisoformat(value).timestamp()
+
+
+def _sources():
+    """source key -> (medications file, medication logs file); one pair per user shard when sharded"""
+    if not SHARDED:
+        return {None: (data_file('medications'), data_file('medication_logs'))}
+    return {user_id: (data_file('medications', user_id), data_file('medication_logs', user_id))
+            for user_id in shard_ids()}
+
+
+class ReminderService:
+    """Fires medication reminders at each scheduled dose's ``scheduled_time``.
+
+    Pending doses live in a min-heap ordered by due time, and one background
+    thread sleeps until the earliest is due, so the cost per reminder is
+    O(log n) however many are pending.
+
+    Storage is the source of truth. ``sync`` re-reads the medication and log
+    files whose version changed since it last looked (one ``os.stat`` each
+    otherwise) and brings the heap in line: new doses are pushed, and doses
+    taken or whose medication is gone are cancelled. It runs every
+    ``sync_interval`` seconds and again right before any reminder fires, so
+    changes made through other worker processes are seen. Changes made in this
+    process are applied at once through ``schedule_medication``,
+    ``cancel_medication`` and ``cancel_dose``. Cancelled entries are dropped
+    when they reach the top of the heap.
+    """
+
+    def __init__(self, notifiers, horizon=timedelta(days=7), grace=timedelta(minutes=15), sync_interval=60):
+        self.notifiers = notifiers
+        self.horizon = horizon
+        self.grace = grace
+        self.sync_interval = sync_interval
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._scheduled = set()          # log ids currently on the heap
+        self._cancelled_logs = set()
+        self._cancelled_meds = set()
+        self._sources = {}               # source key -> (file versions, log ids read from it)
+        self._fired_logs = {}            # log id -> due time, so a re-read does not fire a dose twice
+        self._fired = 0
+        self._syncs = 0
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='medication-reminders', daemon=True)
+            self._thread.start()
+        return self
+
+    def sync(self):
+        """Re-read the medication files changed since the last sync; returns how many sources were read"""
+        sources = _sources()
+        read = 0
+        for key, files in sources.items():
+            versions = tuple(file_version(file_path) for file_path in files)
+            with self._cond:
+                known = self._sources.get(key)
+            if known and known[0] == versions:
+                continue
+            self._replace_source(key, versions, self._read_source(*files))
+            read += 1
+        for key in set(self._sources) - set(sources):
+            self._replace_source(key, None, [])
+            del self._sources[key]
+        with self._cond:
+            earliest = time.time() - self.grace.total_seconds()
+            self._fired_logs = {log_id: due for log_id, due in self._fired_logs.items() if due >= earliest}
+            self._syncs += 1
+        return read
+
+    def _read_source(self, medications_file, logs_file):
+        """Heap entries for every untaken dose due within the horizon in one pair of files"""
+        medications = {med['id']: med for med in iter_records(medications_file)}
+        earliest = time.time() - self.grace.total_seconds()
+        latest = time.time() + self.horizon.total_seconds()
+        entries = []
+        for log in iter_records(logs_file):
+            if log.get('taken') or not log.get('scheduled_time'):
+                continue
+            due = _timestamp(log['scheduled_time'])
+            medication = medications.get(log.get('medication_id'))
+            if medication and earliest <= due <= latest:
+                entries.append(self._entry(due, log, medication))
+        return entries
+
+    def _replace_source(self, key, versions, entries):
+        with self._cond:
+            previous = self._sources[key][1] if key in self._sources else set()
+            current = set()
+            for entry in entries:
+                log_id = entry[2]
+                if log_id in self._fired_logs:
+                    continue
+                current.add(log_id)
+                if log_id in self._scheduled:
+                    self._cancelled_logs.discard(log_id)
+                else:
+                    heapq.heappush(self._heap, entry)
+                    self._scheduled.add(log_id)
+            # Taken since the last read, or its medication was deleted
+            for log_id in previous - current:
+                if log_id in self._scheduled:
+                    self._cancelled_logs.add(log_id)
+            self._sources[key] = (versions, current)
+            self._cond.notify()
+
+    def _entry(self, due, log, medication):
+        return (due, next(self._seq), log['id'], medication['id'], medication['user_id'],
+                f"Time to take {medication['name']} ({medication['dosage']})")
+
+    def schedule_medication(self, medication, logs):
+        """Add reminders for newly created scheduled doses of a medication"""
+        latest = time.time() + self.horizon.total_seconds()
+        with self._cond:
+            self._cancelled_meds.discard(medication['id'])
+            for log in logs:
+                if log.get('taken') or not log.get('scheduled_time') or log['id'] in self._scheduled:
+                    continue
+                due = _timestamp(log['scheduled_time'])
+                if due <= latest:
+                    heapq.heappush(self._heap, self._entry(due, log, medication))
+                    self._scheduled.add(log['id'])
+            self._cond.notify()
+
+    def cancel_medication(self, medication_id):
+        with self._cond:
+            self._cancelled_meds.add(medication_id)
+
+    def cancel_dose(self, log_id):
+        with self._cond:
+            if log_id in self._scheduled:
+                self._cancelled_logs.add(log_id)
+
+    def pending(self):
+        with self._cond:
+            return len(self._scheduled) - len(self._cancelled_logs)
+
+    def _pop_due(self, now):
+        """Pop every live entry due by ``now``; caller holds the lock"""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            log_id, medication_id = entry[2], entry[3]
+            self._scheduled.discard(log_id)
+            if log_id in self._cancelled_logs:
+                self._cancelled_logs.discard(log_id)
+                continue
+            if medication_id in self._cancelled_meds:
+                continue
+            self._fired_logs[log_id] = entry[0]
+            due.append(entry)
+        return due
+
+    def _run(self):
+        next_sync = time.time() + self.sync_interval
+        while True:
+            with self._cond:
+                now = time.time()
+                while now < next_sync and (not self._heap or self._heap[0][0] > now):
+                    timeout = next_sync - now
+                    if self._heap:
+                        timeout = min(timeout, self._heap[0][0] - now)
+                    self._cond.wait(timeout)
+                    now = time.time()
+            # Also right before firing, so a dose taken or deleted through another process is not reminded
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"Reminder sync failed: {e}")
+            next_sync = time.time() + self.sync_interval
+            with self._cond:
+                due = self._pop_due(time.time())
+            for entry in due:
+                self._fire(entry)
+
+    def _fire(self, entry):
+        due, _, log_id, medication_id, user_id, message = entry
+        reminder = {
+            'log_id': log_id,
+            'medication_id': medication_id,
+            'user_id': user_id,
+            'scheduled_time': datetime.fromtimestamp(due).isoformat(),
+            'message': message,
+        }
+        self._fired += 1
+        for notifier in self.notifiers:
+            try:
+                notifier.notify(reminder)
+            except Exception as e:
+                print(f"Reminder notifier {notifier.name} failed: {e}")
+
+    def metrics(self):
+        return {'pending': self.pending(), 'fired': self._fired, 'syncs': self._syncs}
+
+
+def create_reminder_service(notifier_names, **kwargs):
+    """Build, load and start a reminder service from names such as ``['stub', 'speech']``"""
+    notifiers = [NOTIFIERS[name]() for name in notifier_names if name in NOTIFIERS]
+    service = ReminderService(notifiers, **kwargs)
+    service.sync()
+    return service.start()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--notifiers', default=os.getenv('REMINDER_NOTIFIERS', 'stub'),
+                        help='comma-separated: ' + ', '.join(NOTIFIERS))
+    parser.add_argument('--sync-seconds', type=float, default=float(os.getenv('REMINDER_SYNC_SECONDS', '60')),
+                        help='how often to look for medications and doses changed by the web workers')
+    args = parser.parse_args(argv)
+
+    service = create_reminder_service(args.notifiers.split(','), sync_interval=args.sync_seconds)
+    print(f"Reminder service running with {service.pending()} pending reminders")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,307 @@
+"""Record file formats for storage.
+
+Every storage file holds one collection as a sequence of records. A codec
+knows how to read, write, stream and append such a file:
+
+* ``json``: a pretty-printed JSON array, the format the app has always written
+* ``json-compact``: the same array without indentation
+* ``msgpack``: length-prefixed msgpack records (4-byte big-endian length, then
+  the packed record), so appends and streaming reads never parse the whole file.
+  Needs the optional ``msgpack`` package.
+
+Writes and appends both go to a temp file that then replaces the original, so
+readers, which don't take the storage lock, never see a half-written file. An
+append therefore copies the whole file: to build a large file, hand every record
+to ``write_stream`` once rather than appending batch after batch.
+
+The JSON codecs write and fully parse with orjson when it is installed, falling
+back to the standard library. Both read either layout, so switching between them
+needs no conversion. Moving a collection to or from msgpack does; see
+:mod:`utils.convert_storage`.
+"""
+import json
+import os
+import re
+import shutil
+import struct
+import tempfile
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+STREAM_CHUNK_SIZE = 64 * 1024
+_SEPARATORS = re.compile(r'[\s,]*')
+_LENGTH = struct.Struct('>I')
+
+
+def replace_file(tmp_path, file_path):
+    """Move a finished temp file over ``file_path``, keeping the original's permissions"""
+    try:
+        mode = os.stat(file_path).st_mode & 0o777
+    except FileNotFoundError:
+        mode = 0o644  # mkstemp creates files readable by the owner only
+    os.chmod(tmp_path, mode)
+    os.replace(tmp_path, file_path)
+
+
+def _temp_file(file_path):
+    return tempfile.mkstemp(dir=os.path.dirname(file_path) or '.',
+                            prefix=os.path.basename(file_path) + '.', suffix='.tmp')
+
+
+def _write_atomic(file_path, chunks):
+    """Replace ``file_path`` with the concatenated ``chunks`` so readers never see a half-written file"""
+    fd, tmp_path = _temp_file(file_path)
+    try:
+        with os.fdopen(fd, 'wb', buffering=STREAM_CHUNK_SIZE) as f:
+            for chunk in chunks:
+                f.write(chunk)
+        replace_file(tmp_path, file_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _edit_atomic(file_path, edit):
+    """Copy ``file_path``, let ``edit`` change the open copy, then swap the copy in.
+
+    The copy is a plain byte copy (no decoding), so appending stays far cheaper
+    than loading and re-encoding every record, and the live file is never
+    modified in place.
+    """
+    fd, tmp_path = _temp_file(file_path)
+    os.close(fd)
+    try:
+        shutil.copyfile(file_path, tmp_path)
+        with open(tmp_path, 'r+b') as f:
+            edit(f)
+        replace_file(tmp_path, file_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class JsonCodec:
+    """A JSON array of records; ``indent=None`` writes it compact"""
+
+    extension = '.json'
+
+    def __init__(self, name='json', indent=2):
+        if indent not in (None, 2):
+            raise ValueError("indent must be None or 2")
+        self.name = name
+        self.indent = indent
+        # orjson only indents by two spaces, which is also what json.dump(indent=2) wrote
+        self._orjson_option = orjson.OPT_INDENT_2 if orjson is not None and indent else None
+
+    def dumps_record(self, record):
+        if orjson is not None:
+            text = orjson.dumps(record, option=self._orjson_option).decode('utf-8')
+        elif self.indent is None:
+            text = json.dumps(record, separators=(',', ':'))
+        else:
+            text = json.dumps(record, indent=self.indent)
+        return text.replace('\n', '\n' + ' ' * self.indent) if self.indent else text
+
+    def dumps(self, records):
+        if orjson is not None:
+            return orjson.dumps(records, option=self._orjson_option)
+        if self.indent is None:
+            return json.dumps(records, separators=(',', ':')).encode('utf-8')
+        return json.dumps(records, indent=self.indent).encode('utf-8')
+
+    def loads(self, data):
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data)
+
+    def read(self, file_path):
+        with open(file_path, 'rb') as f:
+            return self.loads(f.read())
+
+    def write(self, file_path, records):
+        _write_atomic(file_path, [self.dumps(records)])
+
+    def iter(self, file_path):
+        """Yield records one at a time without loading the whole file"""
+        decoder = json.JSONDecoder()
+        with open(file_path, 'r', encoding='utf-8') as f:
+            buffer = f.read(STREAM_CHUNK_SIZE)
+            pos = _SEPARATORS.match(buffer).end()
+            if buffer[pos:pos + 1] != '[':
+                raise ValueError(f"{file_path} is not a JSON array")
+            pos += 1
+            eof = False
+            while True:
+                pos = _SEPARATORS.match(buffer, pos).end()
+                if buffer[pos:pos + 1] == ']':
+                    return
+                try:
+                    if pos == len(buffer):
+                        raise ValueError("need more data")
+                    record, pos = decoder.raw_decode(buffer, pos)
+                except ValueError:
+                    # The next record is split across chunks; read more and retry
+                    if eof:
+                        raise ValueError(f"{file_path} ends in the middle of a record")
+                    chunk = f.read(STREAM_CHUNK_SIZE)
+                    eof = not chunk
+                    buffer = buffer[pos:] + chunk
+                    pos = 0
+                    continue
+                yield record
+
+    def _layout(self):
+        """(before the first record, between records, after the last) in a non-empty array"""
+        if self.indent is None:
+            return '', ',', ']'
+        first = '\n' + ' ' * self.indent
+        return first, ',' + first, '\n]'
+
+    def write_stream(self, file_path, records):
+        """Write records from any iterable, encoding one at a time; returns how many were written"""
+        first, separator, end = self._layout()
+        count = 0
+
+        def chunks():
+            nonlocal count
+            yield b'['
+            for record in records:
+                yield ((separator if count else first) + self.dumps_record(record)).encode('utf-8')
+                count += 1
+            yield (end if count else ']').encode('utf-8')
+
+        _write_atomic(file_path, chunks())
+        return count
+
+    def append(self, file_path, records):
+        """Append records without re-encoding the existing ones"""
+        first, separator, end = self._layout()
+        body = separator.join(self.dumps_record(record) for record in records)
+
+        def edit(f):
+            # Walk back from the end past the closing bracket and any whitespace
+            pos = f.seek(0, os.SEEK_END)
+            char = b''
+            while pos > 0 and char != b']':
+                pos -= 1
+                f.seek(pos)
+                char = f.read(1)
+            if char != b']':
+                raise ValueError(f"{file_path} is not a JSON array")
+            prev = pos
+            while prev > 0:
+                prev -= 1
+                f.seek(prev)
+                char = f.read(1)
+                if not char.isspace():
+                    break
+            f.seek(prev + 1)
+            f.truncate()
+            f.write(((first if char == b'[' else separator) + body + end).encode('utf-8'))
+
+        _edit_atomic(file_path, edit)
+
+
+class MsgpackCodec:
+    """Length-prefixed msgpack records, one after another"""
+
+    name = 'msgpack'
+    extension = '.msgpack'
+
+    def __init__(self):
+        try:
+            import msgpack
+        except ImportError:
+            raise RuntimeError("The msgpack storage format needs the msgpack package (pip install msgpack)")
+        self._msgpack = msgpack
+
+    def dumps(self, records):
+        frames = []
+        for record in records:
+            packed = self._msgpack.packb(record)
+            frames.append(_LENGTH.pack(len(packed)))
+            frames.append(packed)
+        return b''.join(frames)
+
+    def _records(self, unpacker, source):
+        """Yield records from an Unpacker positioned at a length prefix"""
+        while True:
+            prefix = unpacker.read_bytes(_LENGTH.size)
+            if not prefix:
+                return
+            if len(prefix) < _LENGTH.size:
+                raise ValueError(f"{source} ends in the middle of a length prefix")
+            (length,) = _LENGTH.unpack(prefix)
+            start = unpacker.tell()
+            try:
+                record = unpacker.unpack()
+            except self._msgpack.OutOfData:
+                raise ValueError(f"{source} ends in the middle of a record")
+            if unpacker.tell() - start != length:
+                raise ValueError(f"{source} has a record whose length does not match its prefix")
+            yield record
+
+    def loads(self, data):
+        unpacker = self._msgpack.Unpacker(raw=False, max_buffer_size=max(len(data), 1))
+        unpacker.feed(data)
+        return list(self._records(unpacker, 'msgpack data'))
+
+    def read(self, file_path):
+        with open(file_path, 'rb') as f:
+            return self.loads(f.read())
+
+    def write(self, file_path, records):
+        _write_atomic(file_path, [self.dumps(records)])
+
+    def iter(self, file_path):
+        with open(file_path, 'rb') as f:
+            yield from self._records(self._msgpack.Unpacker(f, raw=False, read_size=STREAM_CHUNK_SIZE), file_path)
+
+    def write_stream(self, file_path, records):
+        """Write records from any iterable, encoding one at a time; returns how many were written"""
+        count = 0
+
+        def chunks():
+            nonlocal count
+            for record in records:
+                yield self.dumps((record,))
+                count += 1
+
+        _write_atomic(file_path, chunks())
+        return count
+
+    def append(self, file_path, records):
+        data = self.dumps(records)
+
+        def edit(f):
+            f.seek(0, os.SEEK_END)
+            f.write(data)
+
+        _edit_atomic(file_path, edit)
+
+
+CODECS = {
+    'json': lambda: JsonCodec('json', indent=2),
+    'json-compact': lambda: JsonCodec('json-compact', indent=None),
+    'msgpack': MsgpackCodec,
+}
+
+
+def get_codec(name):
+    if name not in CODECS:
+        raise ValueError(f"Unknown storage format {name!r}; choose from {sorted(CODECS)}")
+    return CODECS[name]()
+
+
+def parse_formats(value):
+    """Parse ``"medication_logs=msgpack,health_logs=json-compact"`` into a dict"""
+    formats = {}
+    for item in (value or '').split(','):
+        if not item.strip():
+            continue
+        collection, _, name = item.partition('=')
+        formats[collection.strip()] = name.strip()
+    return formats
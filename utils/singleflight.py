@@ -0,0 +1,128 @@
+import asyncio
+import re
+import threading
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_prompt(text):
+    """Normalize a prompt so trivially different spellings share one key"""
+    return _WHITESPACE.sub(' ', (text or '').lower()).strip().rstrip('?!. ')
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one execution.
+
+    The first caller for a key runs ``fn``; every caller that arrives while it is
+    still running waits and receives the same result, or the same exception.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._executions = 0
+        self._coalesced = 0
+        self._errors = 0
+        self._max_waiters = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._coalesced += 1
+                self._max_waiters = max(self._max_waiters, call.waiters)
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._executions += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            with self._lock:
+                self._errors += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def metrics(self):
+        """Counters describing how much upstream work was saved"""
+        with self._lock:
+            return _metrics(self._executions, self._coalesced, self._errors, len(self._calls), self._max_waiters)
+
+
+class AsyncSingleFlight:
+    """:class:`SingleFlight` for coroutines running on one event loop"""
+
+    def __init__(self):
+        self._calls = {}  # key -> (future, waiter count)
+        self._executions = 0
+        self._coalesced = 0
+        self._errors = 0
+        self._max_waiters = 0
+
+    async def do(self, key, coro_fn):
+        call = self._calls.get(key)
+        if call is not None:
+            future, waiters = call
+            self._calls[key] = (future, waiters + 1)
+            self._coalesced += 1
+            self._max_waiters = max(self._max_waiters, waiters + 1)
+            # shield: one waiter disconnecting must not cancel the shared call
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = (future, 0)
+        self._executions += 1
+        try:
+            result = await coro_fn()
+            future.set_result(result)
+            return result
+        except Exception as e:
+            self._errors += 1
+            future.set_exception(e)
+            # Mark the exception retrieved so an un-awaited future doesn't log a warning
+            future.exception()
+            raise
+        finally:
+            del self._calls[key]
+            if not future.done():
+                future.cancel()
+
+    def metrics(self):
+        return _metrics(self._executions, self._coalesced, self._errors, len(self._calls), self._max_waiters)
+
+
+def _metrics(executions, coalesced, errors, in_flight, max_waiters):
+    requests = executions + coalesced
+    return {
+        'requests': requests,
+        'upstream_calls': executions,
+        'coalesced': coalesced,
+        'coalesce_ratio': coalesced / requests if requests else 0.0,
+        'errors': errors,
+        'in_flight': in_flight,
+        'max_waiters': max_waiters,
+    }
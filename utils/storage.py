@@ -1,29 +1,194 @@
 import os
-import json
-import uuid
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from flask_login import UserMixin
 
-# Storage paths
-DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'storage', 'data')
-USERS_FILE = os.path.join(DATA_DIR, 'users.json')
-MEDICATIONS_FILE = os.path.join(DATA_DIR, 'medications.json')
-MED_LOGS_FILE = os.path.join(DATA_DIR, 'medication_logs.json')
-HEALTH_LOGS_FILE = os.path.join(DATA_DIR, 'health_logs.json')
-EMERGENCY_CONTACTS_FILE = os.path.join(DATA_DIR, 'emergency_contacts.json')
+from utils.ids import new_id, recent
+from utils.serializers import get_codec, parse_formats
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only cover threads of one process
+    fcntl = None
+
+# Storage paths (SERENITY_DATA_DIR points the app at another data directory, e.g. for benchmarks)
+DATA_DIR = os.getenv('SERENITY_DATA_DIR') or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'storage', 'data')
+
+COLLECTIONS = ['users', 'medications', 'medication_logs', 'health_logs', 'emergency_contacts']
+
+# File format per collection: STORAGE_FORMAT is the default and STORAGE_FORMATS
+# overrides single collections, e.g. "medication_logs=msgpack,health_logs=json-compact"
+STORAGE_FORMAT = os.getenv('STORAGE_FORMAT', 'json')
+STORAGE_FORMATS = parse_formats(os.getenv('STORAGE_FORMATS'))
+COLLECTION_CODECS = {collection: get_codec(STORAGE_FORMATS.get(collection, STORAGE_FORMAT))
+                     for collection in COLLECTIONS}
+
+def collection_file(collection, data_dir=DATA_DIR):
+    """Path of a collection's file in its configured format"""
+    return os.path.join(data_dir, collection + COLLECTION_CODECS[collection].extension)
+
+USERS_FILE = collection_file('users')
+MEDICATIONS_FILE = collection_file('medications')
+MED_LOGS_FILE = collection_file('medication_logs')
+HEALTH_LOGS_FILE = collection_file('health_logs')
+EMERGENCY_CONTACTS_FILE = collection_file('emergency_contacts')
+
+# STORAGE_LAYOUT=sharded gives every user a directory under users/ holding their
+# slice of each collection, so a request reads and rewrites one user's data only.
+# A small email -> id index serves User.find_by_email. The default "global"
+# layout keeps one file per collection.
+STORAGE_LAYOUT = os.getenv('STORAGE_LAYOUT', 'global')
+SHARDED = STORAGE_LAYOUT == 'sharded'
+USERS_DIR = os.path.join(DATA_DIR, 'users')
+EMAIL_INDEX_FILE = os.path.join(DATA_DIR, 'email_index' + COLLECTION_CODECS['users'].extension)
+
+def user_dir(user_id):
+    """A user's shard directory"""
+    if not user_id or user_id != os.path.basename(user_id) or user_id.startswith('.'):
+        raise ValueError(f"Invalid user id {user_id!r}")
+    return os.path.join(USERS_DIR, user_id)
+
+def data_file(collection, user_id=None):
+    """The file that holds (or will hold) ``collection`` records for ``user_id``"""
+    if not SHARDED:
+        return collection_file(collection)
+    if user_id is None:
+        raise ValueError(f"The sharded layout needs a user id to locate {collection}")
+    return collection_file(collection, user_dir(user_id))
+
+def data_files(collection, user_id=None):
+    """Files to search for ``collection`` records; every shard when the user is not known"""
+    if not SHARDED or user_id is not None:
+        return [data_file(collection, user_id)]
+    return [data_file(collection, shard_id) for shard_id in shard_ids()]
+
+def shard_ids():
+    try:
+        return sorted(os.listdir(USERS_DIR))
+    except FileNotFoundError:
+        return []
+
+_EXTENSION_CODECS = {}
+
+def codec_for(file_path):
+    """Codec for a storage file: its collection's configured one, else guessed from the extension"""
+    collection, extension = os.path.splitext(os.path.basename(file_path))
+    codec = COLLECTION_CODECS.get(collection)
+    if codec is None or codec.extension != extension:
+        name = 'msgpack' if extension == '.msgpack' else 'json'
+        codec = _EXTENSION_CODECS.get(name)
+        if codec is None:
+            codec = _EXTENSION_CODECS[name] = get_codec(name)
+    return codec
+
+def file_version(file_path):
+    """(inode, mtime, size) of a storage file, or None when it does not exist.
+
+    Storage replaces files rather than rewriting them, so a new inode marks any
+    write, even one that leaves the size and a coarse mtime unchanged. Caches
+    kept per process compare it to notice writes made by other workers.
+    """
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+def load_records(file_path):
+    """Read every record in a storage file; a missing file is an empty collection"""
+    if not os.path.exists(file_path):
+        return []
+    return codec_for(file_path).read(file_path)
+
+def save_records(file_path, records):
+    """Replace a storage file's contents with ``records``"""
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    codec_for(file_path).write(file_path, records)
+
+_file_locks = {}
+_file_locks_guard = threading.Lock()
+
+@contextmanager
+def file_lock(file_path):
+    """Serialize read-modify-write cycles on one file across threads and worker processes.
+
+    The lock is taken on a ``.lock`` file next to the data file, because
+    save_records replaces the data file itself.
+    """
+    with _file_locks_guard:
+        lock = _file_locks.setdefault(file_path, threading.Lock())
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path + '.lock', 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
 
 # Ensure data directory exists
 os.makedirs(DATA_DIR, exist_ok=True)
 
 # Initialize data files if they don't exist
 def init_data_files():
+    if SHARDED:
+        # Refuse to start empty next to data that has not been split into shards yet
+        if not shard_ids() and load_records(USERS_FILE):
+            raise RuntimeError(f"{USERS_FILE} has users but {USERS_DIR} has no shards; split it with "
+                               f"python -m utils.convert_storage --layout sharded")
+        os.makedirs(USERS_DIR, exist_ok=True)
+        return
     for file_path in [USERS_FILE, MEDICATIONS_FILE, MED_LOGS_FILE, HEALTH_LOGS_FILE, EMERGENCY_CONTACTS_FILE]:
         if not os.path.exists(file_path):
-            with open(file_path, 'w') as f:
-                json.dump([], f)
+            # Refuse to start empty next to data kept in another format
+            base = os.path.splitext(file_path)[0]
+            for other in ('.json', '.msgpack'):
+                if os.path.exists(base + other):
+                    raise RuntimeError(f"{file_path} is missing but {base + other} exists; convert it with "
+                                       f"python -m utils.convert_storage")
+            save_records(file_path, [])
 
 init_data_files()
 
+def iter_records(file_path):
+    """Yield records from a storage file one at a time without loading the whole file"""
+    if not os.path.exists(file_path):
+        return iter(())
+    return codec_for(file_path).iter(file_path)
+
+def iter_collection(collection):
+    """Yield every record of a collection, across all shards in the sharded layout"""
+    for file_path in data_files(collection):
+        yield from iter_records(file_path)
+
+def append_records(file_path, records):
+    """Append records to a storage file without re-encoding existing records"""
+    if not records:
+        return 0
+    if os.path.exists(file_path):
+        codec_for(file_path).append(file_path, records)
+    else:
+        save_records(file_path, records)
+    return len(records)
+
+_email_index = {'version': None, 'ids': {}}
+
+def _email_ids():
+    """email -> user id from the sharded layout's index, re-read only when the file changes"""
+    try:
+        stat = os.stat(EMAIL_INDEX_FILE)
+    except FileNotFoundError:
+        return {}
+    version = (stat.st_mtime_ns, stat.st_size)
+    if version != _email_index['version']:
+        ids = {entry['email']: entry['id'] for entry in iter_records(EMAIL_INDEX_FILE)}
+        _email_index.update(version=version, ids=ids)
+    return _email_index['ids']
+
 # Health tips for the application
 HEALTH_TIPS = [
     "Try to walk for at least 30 minutes each day.",
@@ -58,27 +223,28 @@ class User(UserMixin):
     @classmethod
     def get(cls, user_id):
         """Get user by ID"""
-        with open(USERS_FILE, 'r') as f:
-            users = json.load(f)
-            for user in users:
-                if user['id'] == user_id:
-                    return cls(**user)
+        users = load_records(data_file('users', user_id))
+        for user in users:
+            if user['id'] == user_id:
+                return cls(**user)
         return None
     
     @classmethod
     def find_by_email(cls, email):
         """Find user by email"""
-        with open(USERS_FILE, 'r') as f:
-            users = json.load(f)
-            for user in users:
-                if user['email'] == email:
-                    return cls(**user)
+        if SHARDED:
+            user_id = _email_ids().get(email)
+            return cls.get(user_id) if user_id else None
+        users = load_records(USERS_FILE)
+        for user in users:
+            if user['email'] == email:
+                return cls(**user)
         return None
     
     @classmethod
     def create(cls, email, name, profile_picture=None):
         """Create a new user"""
-        user_id = str(uuid.uuid4())
+        user_id = new_id()
         new_user = {
             'id': user_id,
             'email': email,
@@ -87,32 +253,34 @@ class User(UserMixin):
             'created_at': datetime.now().isoformat()
         }
         
-        with open(USERS_FILE, 'r') as f:
-            users = json.load(f)
+        users_file = data_file('users', user_id)
+        with file_lock(users_file):
+            users = load_records(users_file)
+            users.append(new_user)
+            save_records(users_file, users)
         
-        users.append(new_user)
-        
-        with open(USERS_FILE, 'w') as f:
-            json.dump(users, f, indent=2)
+        if SHARDED:
+            with file_lock(EMAIL_INDEX_FILE):
+                index = load_records(EMAIL_INDEX_FILE)
+                index.append({'email': email, 'id': user_id})
+                save_records(EMAIL_INDEX_FILE, index)
         
         return cls(**new_user)
     
     def get_medications(self):
         """Get all medications for this user"""
-        with open(MEDICATIONS_FILE, 'r') as f:
-            medications = json.load(f)
-            return [med for med in medications if med['user_id'] == self.id]
+        medications = load_records(data_file('medications', self.id))
+        return [med for med in medications if med['user_id'] == self.id]
     
     def get_emergency_contacts(self):
         """Get all emergency contacts for this user"""
-        with open(EMERGENCY_CONTACTS_FILE, 'r') as f:
-            contacts = json.load(f)
-            return [contact for contact in contacts if contact['user_id'] == self.id]
+        contacts = load_records(data_file('emergency_contacts', self.id))
+        return [contact for contact in contacts if contact['user_id'] == self.id]
 
 # Medication functions
 def add_medication(user_id, name, dosage, frequency, time, start_date, end_date=None, notes=None):
     """Add a medication for a user"""
-    medication_id = str(uuid.uuid4())
+    medication_id = new_id()
     
     # Convert datetime objects to ISO format strings for JSON serialization
     if isinstance(start_date, datetime):
@@ -134,56 +302,53 @@ def add_medication(user_id, name, dosage, frequency, time, start_date, end_date=
         'created_at': datetime.now().isoformat()
     }
     
-    with open(MEDICATIONS_FILE, 'r') as f:
-        medications = json.load(f)
-    
-    medications.append(new_medication)
-    
-    with open(MEDICATIONS_FILE, 'w') as f:
-        json.dump(medications, f, indent=2)
+    medications_file = data_file('medications', user_id)
+    with file_lock(medications_file):
+        medications = load_records(medications_file)
+        medications.append(new_medication)
+        save_records(medications_file, medications)
     
     return new_medication
 
-def get_medication(medication_id):
-    """Get medication by ID"""
-    with open(MEDICATIONS_FILE, 'r') as f:
-        medications = json.load(f)
+def get_medication(medication_id, user_id=None):
+    """Get medication by ID; passing the owner's id avoids searching every shard"""
+    for medications_file in data_files('medications', user_id):
+        medications = load_records(medications_file)
         for med in medications:
             if med['id'] == medication_id:
                 return med
     return None
 
-def delete_medication(medication_id):
+def delete_medication(medication_id, user_id=None):
     """Delete a medication and its associated logs"""
-    # Delete the medication
-    with open(MEDICATIONS_FILE, 'r') as f:
-        medications = json.load(f)
-    
-    # Find the medication index
-    medication_index = None
-    for i, med in enumerate(medications):
-        if med['id'] == medication_id:
-            medication_index = i
-            break
-    
-    # If medication found, remove it
-    if medication_index is not None:
-        deleted_medication = medications.pop(medication_index)
-        
-        # Save updated medications list
-        with open(MEDICATIONS_FILE, 'w') as f:
-            json.dump(medications, f, indent=2)
+    for medications_file in data_files('medications', user_id):
+        with file_lock(medications_file):
+            medications = load_records(medications_file)
+            
+            # Find the medication index
+            medication_index = None
+            for i, med in enumerate(medications):
+                if med['id'] == medication_id:
+                    medication_index = i
+                    break
+            
+            if medication_index is None:
+                continue
+            
+            # Remove it and save updated medications list
+            deleted_medication = medications.pop(medication_index)
+            save_records(medications_file, medications)
         
         # Also delete associated medication logs
-        with open(MED_LOGS_FILE, 'r') as f:
-            logs = json.load(f)
-        
-        # Filter out logs for this medication
-        updated_logs = [log for log in logs if log['medication_id'] != medication_id]
-        
-        # Save updated logs
-        with open(MED_LOGS_FILE, 'w') as f:
-            json.dump(updated_logs, f, indent=2)
+        logs_file = data_file('medication_logs', deleted_medication['user_id'])
+        with file_lock(logs_file):
+            logs = load_records(logs_file)
+            
+            # Filter out logs for this medication
+            updated_logs = [log for log in logs if log['medication_id'] != medication_id]
+            
+            # Save updated logs
+            save_records(logs_file, updated_logs)
         
         return deleted_medication
     
@@ -192,7 +357,7 @@ def delete_medication(medication_id):
 # Medication log functions
 def add_medication_log(medication_id=None, scheduled_time=None, taken=False, taken_time=None, notes=None, user_id=None, medication_name=None, timestamp=None):
     """Add a medication log"""
-    log_id = str(uuid.uuid4())
+    log_id = new_id()
     new_log = {
         'id': log_id,
         'medication_id': medication_id,
@@ -205,24 +370,88 @@ def add_medication_log(medication_id=None, scheduled_time=None, taken=False, tak
         'timestamp': timestamp or datetime.now().isoformat()
     }
     
-    with open(MED_LOGS_FILE, 'r') as f:
-        logs = json.load(f)
-    
-    logs.append(new_log)
+    owner_id = user_id
+    if SHARDED and owner_id is None:
+        # Logs are stored with their medication's owner
+        medication = get_medication(medication_id)
+        owner_id = medication['user_id'] if medication else None
     
-    with open(MED_LOGS_FILE, 'w') as f:
-        json.dump(logs, f, indent=2)
+    logs_file = data_file('medication_logs', owner_id)
+    with file_lock(logs_file):
+        logs = load_records(logs_file)
+        logs.append(new_log)
+        save_records(logs_file, logs)
     
     return new_log
 
-def get_medication_logs(medication_id, limit=None):
+def mark_doses_taken(medications, user_id, taken_time=None, notes=None):
+    """Mark each medication's scheduled dose taken with a single storage write.
+
+    The dose taken is the open one scheduled nearest ``taken_time`` on the same
+    day, found in one pass over the logs loaded here under the file lock, so
+    doses created or taken through another worker process are seen. Only when a
+    medication has no open dose that day is a new taken log added. Returns the
+    resulting logs in the same order as ``medications``.
+    """
+    taken_time = taken_time or datetime.now().isoformat()
+    when = datetime.fromisoformat(taken_time)
+    day = when.date().isoformat()
+    wanted = {medication['id'] for medication in medications}
+    logs_file = data_file('medication_logs', user_id)
+    with file_lock(logs_file):
+        logs = load_records(logs_file)
+        days_doses = {}  # medication_id -> that day's open scheduled logs
+        for log in logs:
+            scheduled = log.get('scheduled_time')
+            if scheduled and scheduled[:10] == day and not log.get('taken') and log.get('medication_id') in wanted:
+                days_doses.setdefault(log['medication_id'], []).append(log)
+
+        results = []
+        for medication in medications:
+            open_doses = days_doses.get(medication['id'], [])
+            log = _nearest_dose(open_doses, when)
+            if log is not None:
+                open_doses.remove(log)
+                log.update({
+                    'taken': True,
+                    'taken_time': taken_time,
+                    'notes': notes,
+                    'user_id': user_id,
+                    'medication_name': medication['name']
+                })
+            else:
+                log = {
+                    'id': new_id(),
+                    'medication_id': medication['id'],
+                    'scheduled_time': None,
+                    'taken': True,
+                    'taken_time': taken_time,
+                    'notes': notes,
+                    'user_id': user_id,
+                    'medication_name': medication['name'],
+                    'timestamp': taken_time
+                }
+                logs.append(log)
+            results.append(log)
+        save_records(logs_file, logs)
+    return results
+
+def _nearest_dose(logs, when):
+    """The log scheduled nearest ``when``, preferring the earlier one on a tie, or None"""
+    def distance(log):
+        scheduled = datetime.fromisoformat(log['scheduled_time'])
+        return (abs((scheduled - when).total_seconds()), scheduled)
+    return min(logs, key=distance, default=None)
+
+def get_medication_logs(medication_id, limit=None, user_id=None):
     """Get medication logs for a medication"""
-    with open(MED_LOGS_FILE, 'r') as f:
-        logs = json.load(f)
-        filtered_logs = [log for log in logs if log['medication_id'] == medication_id]
-        
-    # Sort by scheduled time (newest first)
-    filtered_logs.sort(key=lambda x: x['scheduled_time'], reverse=True)
+    filtered_logs = []
+    for logs_file in data_files('medication_logs', user_id):
+        logs = load_records(logs_file)
+        filtered_logs.extend(log for log in logs if log['medication_id'] == medication_id)
+    
+    # Sort by scheduled time (newest first); doses taken off-schedule have none, so use when they were logged
+    filtered_logs.sort(key=lambda x: x['scheduled_time'] or x['timestamp'], reverse=True)
     
     if limit:
         filtered_logs = filtered_logs[:limit]
@@ -234,7 +463,7 @@ def add_health_log(user_id, mood, pain_level=None, notes=None, energy_level=None
                    appetite=None, mobility=None, heart_rate=None, breathing_difficulty=None, 
                    hydration_level=None, medication_taken=None, bowel_movement=None):
     """Add a health log for a user"""
-    log_id = str(uuid.uuid4())
+    log_id = new_id()
     new_log = {
         'id': log_id,
         'user_id': user_id,
@@ -253,34 +482,26 @@ def add_health_log(user_id, mood, pain_level=None, notes=None, energy_level=None
         'bowel_movement': bowel_movement
     }
     
-    with open(HEALTH_LOGS_FILE, 'r') as f:
-        logs = json.load(f)
-    
-    logs.append(new_log)
-    
-    with open(HEALTH_LOGS_FILE, 'w') as f:
-        json.dump(logs, f, indent=2)
+    logs_file = data_file('health_logs', user_id)
+    with file_lock(logs_file):
+        logs = load_records(logs_file)
+        logs.append(new_log)
+        save_records(logs_file, logs)
     
     return new_log
 
-def get_recent_health_logs(user_id, limit=10):
-    """Get recent health logs for a user"""
-    with open(HEALTH_LOGS_FILE, 'r') as f:
-        logs = json.load(f)
-        filtered_logs = [log for log in logs if log['user_id'] == user_id]
-    
-    # Sort by timestamp (newest first)
-    filtered_logs.sort(key=lambda x: x['timestamp'], reverse=True)
+def get_recent_health_logs(user_id, limit=10, before=None):
+    """Get recent health logs for a user, newest first; ``before`` is the id of the last log already shown"""
+    logs = load_records(data_file('health_logs', user_id))
+    filtered_logs = (log for log in logs if log['user_id'] == user_id)
     
-    if limit:
-        filtered_logs = filtered_logs[:limit]
-    
-    return filtered_logs
+    # Ordered by id, which is time-ordered for new logs (see utils.ids)
+    return recent(filtered_logs, limit, before=before)
 
 # Emergency contact functions
 def add_emergency_contact(user_id, name, relationship, phone, email=None, is_primary=False):
     """Add an emergency contact for a user"""
-    contact_id = str(uuid.uuid4())
+    contact_id = new_id()
     new_contact = {
         'id': contact_id,
         'user_id': user_id,
@@ -292,42 +513,42 @@ def add_emergency_contact(user_id, name, relationship, phone, email=None, is_pri
         'created_at': datetime.now().isoformat()
     }
     
-    with open(EMERGENCY_CONTACTS_FILE, 'r') as f:
-        contacts = json.load(f)
-    
-    # If this is a primary contact, set existing primary contacts to non-primary
-    if is_primary:
-        for contact in contacts:
-            if contact['user_id'] == user_id and contact['is_primary']:
-                contact['is_primary'] = False
-    
-    contacts.append(new_contact)
-    
-    with open(EMERGENCY_CONTACTS_FILE, 'w') as f:
-        json.dump(contacts, f, indent=2)
+    contacts_file = data_file('emergency_contacts', user_id)
+    with file_lock(contacts_file):
+        contacts = load_records(contacts_file)
+        
+        # If this is a primary contact, set existing primary contacts to non-primary
+        if is_primary:
+            for contact in contacts:
+                if contact['user_id'] == user_id and contact['is_primary']:
+                    contact['is_primary'] = False
+        
+        contacts.append(new_contact)
+        
+        save_records(contacts_file, contacts)
     
     return new_contact
 
-def delete_emergency_contact(contact_id):
+def delete_emergency_contact(contact_id, user_id=None):
     """Delete an emergency contact by ID"""
-    with open(EMERGENCY_CONTACTS_FILE, 'r') as f:
-        contacts = json.load(f)
-    
-    # Find the contact index
-    contact_index = None
-    for i, contact in enumerate(contacts):
-        if contact['id'] == contact_id:
-            contact_index = i
-            break
-    
-    # If contact found, remove it
-    if contact_index is not None:
-        deleted_contact = contacts.pop(contact_index)
-        
-        # Save updated contacts list
-        with open(EMERGENCY_CONTACTS_FILE, 'w') as f:
-            json.dump(contacts, f, indent=2)
-        
-        return deleted_contact
+    for contacts_file in data_files('emergency_contacts', user_id):
+        with file_lock(contacts_file):
+            contacts = load_records(contacts_file)
+            
+            # Find the contact index
+            contact_index = None
+            for i, contact in enumerate(contacts):
+                if contact['id'] == contact_id:
+                    contact_index = i
+                    break
+            
+            # If contact found, remove it
+            if contact_index is not None:
+                deleted_contact = contacts.pop(contact_index)
+                
+                # Save updated contacts list
+                save_records(contacts_file, contacts)
+                
+                return deleted_contact
     
     return None
\ No newline at end of file
@@ -0,0 +1,211 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+
+class UpstreamUnavailable(Exception):
+    """Raised when a call is refused or abandoned instead of reaching the upstream"""
+
+    def __init__(self, reason):
+        super().__init__(f"Upstream unavailable: {reason}")
+        self.reason = reason
+
+
+class CircuitBreaker:
+    """Remember upstream failures and stop calling it while it is unhealthy.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and every
+    call is refused for ``reset_timeout`` seconds. It then lets a single probe
+    through (half-open); success closes it again, failure re-opens it.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.times_opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self):
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def release(self):
+        """Hand back a probe slot taken by ``allow`` for a call that never reached the upstream"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.times_opened += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+
+class _AdmissionStats:
+    """Configuration and counters shared by the sync and async guards"""
+
+    def __init__(self, max_concurrent, queue_timeout, call_timeout, breaker):
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self.call_timeout = call_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self._lock = threading.Lock()
+        self._counters = {
+            'admitted': 0,
+            'rejected_circuit_open': 0,
+            'rejected_queue_timeout': 0,
+            'timeouts': 0,
+            'failures': 0,
+            'successes': 0,
+        }
+        self._in_flight = 0
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _admit(self):
+        with self._lock:
+            self._counters['admitted'] += 1
+            self._in_flight += 1
+
+    def _finish(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def metrics(self):
+        with self._lock:
+            data = dict(self._counters)
+            data['in_flight'] = self._in_flight
+        data['max_concurrent'] = self.max_concurrent
+        data['circuit_state'] = self.breaker.state
+        data['circuit_opened'] = self.breaker.times_opened
+        return data
+
+
+class UpstreamGuard(_AdmissionStats):
+    """Admission control around a slow upstream call.
+
+    * at most ``max_concurrent`` calls run at once; callers wait up to
+      ``queue_timeout`` seconds for a slot before being turned away
+    * each call is abandoned after ``call_timeout`` seconds
+    * a :class:`CircuitBreaker` refuses calls outright while the upstream is failing
+
+    A call that times out keeps its slot until the upstream actually returns, so
+    a hung upstream cannot pull more than ``max_concurrent`` threads with it.
+    """
+
+    def __init__(self, max_concurrent=4, queue_timeout=2.0, call_timeout=15.0, breaker=None):
+        super().__init__(max_concurrent, queue_timeout, call_timeout, breaker)
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='upstream')
+
+    def _release(self, _future):
+        self._finish()
+        self._slots.release()
+
+    def call(self, fn):
+        if not self.breaker.allow():
+            self._count('rejected_circuit_open')
+            raise UpstreamUnavailable('circuit_open')
+
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._count('rejected_queue_timeout')
+            # Our own queue being full says nothing about the upstream's health
+            self.breaker.release()
+            raise UpstreamUnavailable('queue_timeout')
+
+        self._admit()
+        future = self._executor.submit(fn)
+        future.add_done_callback(self._release)
+
+        try:
+            result = future.result(timeout=self.call_timeout)
+        except FutureTimeoutError:
+            self._count('timeouts')
+            self.breaker.record_failure()
+            raise UpstreamUnavailable('timeout')
+        except Exception:
+            self._count('failures')
+            self.breaker.record_failure()
+            raise
+
+        self._count('successes')
+        self.breaker.record_success()
+        return result
+
+
+class AsyncUpstreamGuard(_AdmissionStats):
+    """:class:`UpstreamGuard` for coroutines; a timed-out call is cancelled and frees its slot"""
+
+    def __init__(self, max_concurrent=64, queue_timeout=2.0, call_timeout=15.0, breaker=None):
+        super().__init__(max_concurrent, queue_timeout, call_timeout, breaker)
+        self._slots = None  # created on first use, inside the server's event loop
+
+    async def call(self, coro_fn):
+        if not self.breaker.allow():
+            self._count('rejected_circuit_open')
+            raise UpstreamUnavailable('circuit_open')
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._count('rejected_queue_timeout')
+            self.breaker.release()
+            raise UpstreamUnavailable('queue_timeout')
+
+        self._admit()
+        try:
+            result = await asyncio.wait_for(coro_fn(), self.call_timeout)
+        except asyncio.TimeoutError:
+            self._count('timeouts')
+            self.breaker.record_failure()
+            raise UpstreamUnavailable('timeout')
+        except Exception:
+            self._count('failures')
+            self.breaker.record_failure()
+            raise
+        finally:
+            self._finish()
+            self._slots.release()
+
+        self._count('successes')
+        self.breaker.record_success()
+        return result
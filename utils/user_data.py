@@ -0,0 +1,216 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from utils.ids import new_id
+from utils.storage import SHARDED, data_file, data_files, file_lock, iter_records, append_records
+
+# Export order matters: medications come before their logs so an import of an
+# export can map old medication ids to the new ones as it goes.
+COLLECTIONS = ['medications', 'medication_logs', 'health_logs']
+
+FIELDS = {
+    'medications': ['id', 'user_id', 'name', 'dosage', 'frequency', 'time', 'start_date',
+                    'end_date', 'notes', 'created_at'],
+    'medication_logs': ['id', 'medication_id', 'scheduled_time', 'taken', 'taken_time', 'notes',
+                        'user_id', 'medication_name', 'timestamp'],
+    'health_logs': ['id', 'user_id', 'mood', 'pain_level', 'notes', 'timestamp', 'energy_level',
+                    'sleep_quality', 'appetite', 'mobility', 'heart_rate', 'breathing_difficulty',
+                    'hydration_level', 'medication_taken', 'bowel_movement'],
+}
+
+FREQUENCIES = {'daily', 'twice_daily', 'three_times_daily', 'four_times_daily', 'weekly', 'biweekly', 'monthly'}
+MOODS = {'great', 'good', 'okay', 'bad', 'terrible'}
+
+# Every flush copies the target file (appends go through a temp copy, see utils.serializers).
+# In the global layout that is the whole collection, so flush far less often there.
+IMPORT_BATCH_SIZE = 500 if SHARDED else 10000
+MAX_REPORTED_ERRORS = 20
+
+
+class RecordValidationError(ValueError):
+    """A single imported record failed validation"""
+
+
+def _iter_files(collection, user_id):
+    for file_path in data_files(collection, user_id):
+        yield from iter_records(file_path)
+
+
+def _user_medication_ids(user_id):
+    return {med['id'] for med in _iter_files('medications', user_id) if med['user_id'] == user_id}
+
+
+def iter_user_records(user_id, collections=COLLECTIONS):
+    """Yield ``(collection, record)`` for everything a user owns, streaming each file"""
+    medication_ids = None
+    for collection in COLLECTIONS:
+        if collection not in collections:
+            continue
+        if collection == 'medication_logs':
+            # Scheduled doses are created without a user_id, so match them through the medication
+            if medication_ids is None:
+                medication_ids = _user_medication_ids(user_id)
+            for log in _iter_files('medication_logs', user_id):
+                if log.get('user_id') == user_id or log.get('medication_id') in medication_ids:
+                    yield collection, log
+        else:
+            for record in _iter_files(collection, user_id):
+                if record.get('user_id') == user_id:
+                    yield collection, record
+
+
+def export_ndjson(user_id, collections=COLLECTIONS):
+    """One JSON object per line, tagged with its collection"""
+    for collection, record in iter_user_records(user_id, collections):
+        yield json.dumps({'collection': collection, **record}) + '\n'
+
+
+def export_csv(user_id, collection):
+    """CSV for a single collection, one row per record"""
+    fields = FIELDS[collection]
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore')
+    writer.writeheader()
+    for _, record in iter_user_records(user_id, [collection]):
+        writer.writerow(record)
+        if buffer.tell() >= 8192:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _require_iso(value, field, optional=False):
+    if value in (None, '') and optional:
+        return None
+    try:
+        return datetime.fromisoformat(str(value)).isoformat()
+    except ValueError:
+        raise RecordValidationError(f"{field} must be an ISO date/time, got {value!r}")
+
+
+def _backdated_id(at, field):
+    """A time-ordered id carrying ``at``, the record's already validated creation time"""
+    try:
+        return new_id(at)
+    except (ValueError, OverflowError):
+        raise RecordValidationError(f"{field} must be on or after 1970-01-01, got {at!r}")
+
+
+def _validate_medication(data, user_id):
+    for field in ('name', 'dosage', 'frequency', 'time', 'start_date'):
+        if not data.get(field):
+            raise RecordValidationError(f"{field} is required")
+    if data['frequency'] not in FREQUENCIES:
+        raise RecordValidationError(f"unknown frequency {data['frequency']!r}")
+    try:
+        datetime.strptime(data['time'], '%H:%M')
+    except (TypeError, ValueError):
+        raise RecordValidationError(f"time must be HH:MM, got {data['time']!r}")
+    created_at = _require_iso(data.get('created_at') or datetime.now().isoformat(), 'created_at')
+    return {
+        'id': _backdated_id(created_at, 'created_at'),
+        'user_id': user_id,
+        'name': str(data['name']),
+        'dosage': str(data['dosage']),
+        'frequency': data['frequency'],
+        'time': data['time'],
+        'start_date': _require_iso(data['start_date'], 'start_date'),
+        'end_date': _require_iso(data.get('end_date'), 'end_date', optional=True),
+        'notes': data.get('notes'),
+        'created_at': created_at,
+    }
+
+
+def _validate_medication_log(data, user_id, medication_ids):
+    medication_id = medication_ids.get(data.get('medication_id'))
+    if medication_id is None:
+        raise RecordValidationError(f"medication {data.get('medication_id')!r} does not belong to this user")
+    taken = data.get('taken')
+    if isinstance(taken, str):
+        taken = taken.lower() in ('true', '1', 'yes')
+    timestamp = _require_iso(data.get('timestamp') or datetime.now().isoformat(), 'timestamp')
+    return {
+        'id': _backdated_id(timestamp, 'timestamp'),
+        'medication_id': medication_id,
+        'scheduled_time': _require_iso(data.get('scheduled_time'), 'scheduled_time', optional=True),
+        'taken': bool(taken),
+        'taken_time': _require_iso(data.get('taken_time'), 'taken_time', optional=True),
+        'notes': data.get('notes'),
+        'user_id': user_id,
+        'medication_name': data.get('medication_name'),
+        'timestamp': timestamp,
+    }
+
+
+def _validate_health_log(data, user_id):
+    if data.get('mood') not in MOODS:
+        raise RecordValidationError(f"mood must be one of {sorted(MOODS)}")
+    record = {field: data.get(field) for field in FIELDS['health_logs']}
+    record['user_id'] = user_id
+    record['timestamp'] = _require_iso(data.get('timestamp'), 'timestamp')
+    # Ids of imported records carry their original time so id order matches history
+    record['id'] = _backdated_id(record['timestamp'], 'timestamp')
+    return record
+
+
+def import_records(user_id, lines, batch_size=IMPORT_BATCH_SIZE):
+    """Validate NDJSON lines and append them to storage in batches.
+
+    Every record gets a fresh id and the importing user's id. Medication logs
+    may reference a medication from earlier in the same import (by its old id)
+    or one the user already has.
+    """
+    # old or existing medication id -> id stored for this user
+    medication_ids = {med_id: med_id for med_id in _user_medication_ids(user_id)}
+    batches = {collection: [] for collection in COLLECTIONS}
+    imported = {collection: 0 for collection in COLLECTIONS}
+    errors = []
+    error_count = 0
+
+    def flush(collection):
+        file_path = data_file(collection, user_id)
+        with file_lock(file_path):
+            imported[collection] += append_records(file_path, batches[collection])
+        batches[collection] = []
+
+    for line_number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        try:
+            try:
+                data = json.loads(line)
+            except ValueError:
+                raise RecordValidationError("invalid JSON")
+            if not isinstance(data, dict):
+                raise RecordValidationError("each line must be a JSON object")
+            collection = data.get('collection')
+            if collection == 'medications':
+                record = _validate_medication(data, user_id)
+                if data.get('id'):
+                    medication_ids[data['id']] = record['id']
+                medication_ids[record['id']] = record['id']
+            elif collection == 'medication_logs':
+                record = _validate_medication_log(data, user_id, medication_ids)
+            elif collection == 'health_logs':
+                record = _validate_health_log(data, user_id)
+            else:
+                raise RecordValidationError(f"unknown collection {collection!r}")
+        except RecordValidationError as e:
+            error_count += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({'line': line_number, 'error': str(e)})
+            continue
+
+        batches[collection].append(record)
+        if len(batches[collection]) >= batch_size:
+            flush(collection)
+
+    for collection in COLLECTIONS:
+        flush(collection)
+
+    return {'imported': imported, 'error_count': error_count, 'errors': errors}